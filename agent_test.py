@@ -3,10 +3,20 @@ tests to run and debug your minimax and alphabeta agents locally.  The test
 cases used by the project assistant are not public.
 """
 
+import inspect
+import itertools
+import os
+import pickle
+import tempfile
+import timeit
 import unittest
 
 import sample_players
 import isolation
+import parallel_agent
+import proof_number
+import shared_table
+import tablebase
 import game_agent
 import random 
 
@@ -103,5 +113,853 @@ class IsolationTest(unittest.TestCase):
     #     print("summary from {} games; \n\tplayer 1 wins: {} \n\tplayer 2 wins: {}".format(
     #         num_games, player_1_wins, player_2_wins))
 
+
+def minimax_value(game, player, score_fn, depth):
+    """Reference depth-limited minimax value of a position, without pruning"""
+    legal_moves = game.get_legal_moves()
+    if depth == 0 or not legal_moves:
+        return score_fn(game, player)
+    values = [minimax_value(game.forecast_move(m), player, score_fn, depth - 1)
+              for m in legal_moves]
+    return max(values) if game.active_player == player else min(values)
+
+
+def random_position(player1, player2, num_moves, width=7, height=7):
+    """Return a board after `num_moves` random moves"""
+    game = isolation.Board(player1, player2, width=width, height=height)
+    for _ in range(num_moves):
+        legal_moves = game.get_legal_moves()
+        if not legal_moves:
+            break
+        game.apply_move(random.choice(legal_moves))
+    return game
+
+
+def node_limit(player, nodes):
+    """Make the searches of `player` time out after `nodes` nodes"""
+    def check_clock():
+        if player._nodes > nodes:
+            raise game_agent.SearchTimeout()
+    player.check_clock = check_clock
+
+
+def countdown(time_limit):
+    """Return a time_left function for a turn of `time_limit` milliseconds"""
+    start = 1000 * timeit.default_timer()
+    return lambda: time_limit - (1000 * timeit.default_timer() - start)
+
+
+class SearchTest(unittest.TestCase):
+    """Check the search agents against a reference minimax search"""
+
+    def test_transposition_table(self):
+        table = game_agent.TranspositionTable(size=5)
+        self.assertEqual(table.size, 8)
+        table.store(3, 4, 1.5, game_agent.EXACT, (1, 2))
+        self.assertEqual(table.lookup(3), (4, 1.5, game_agent.EXACT, (1, 2)))
+        self.assertIsNone(table.lookup(11))
+        # a shallower result for a colliding position does not evict the deeper one
+        table.store(11, 2, 0.5, game_agent.LOWER_BOUND, (0, 0))
+        self.assertIsNone(table.lookup(11))
+        table.store(11, 6, 0.5, game_agent.LOWER_BOUND, (0, 0))
+        self.assertIsNone(table.lookup(3))
+        self.assertEqual(table.lookup(11), (6, 0.5, game_agent.LOWER_BOUND, (0, 0)))
+        # the same rule applies to a new result for the same position, and a
+        # bound never replaces an exact score of the same depth
+        table.store(11, 5, 2.5, game_agent.EXACT, (0, 1))
+        table.store(5, 3, 1.0, game_agent.EXACT, (2, 2))
+        table.store(5, 3, 4.0, game_agent.UPPER_BOUND, (2, 3))
+        self.assertEqual(table.lookup(11), (6, 0.5, game_agent.LOWER_BOUND, (0, 0)))
+        self.assertEqual(table.lookup(5), (3, 1.0, game_agent.EXACT, (2, 2)))
+        table.store(5, 3, 2.0, game_agent.EXACT, (2, 3))
+        self.assertEqual(table.lookup(5), (3, 2.0, game_agent.EXACT, (2, 3)))
+
+    def test_transposition_table_lifecycle(self):
+        table = game_agent.TranspositionTable(size=8)
+        table.store(3, 6, 1.5, game_agent.EXACT, (1, 2))
+        table.new_search()
+        # entries from an earlier search are replaced even by shallower results
+        table.store(11, 2, 0.5, game_agent.EXACT, (0, 0))
+        self.assertIsNone(table.lookup(3))
+        self.assertIsNotNone(table.lookup(11))
+        self.assertEqual(table.hit_rate, 0.5)
+        self.assertEqual(table.occupancy, 1 / 8.)
+
+        player = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score, table_size=64,
+                                            manage_time=False)
+        opponent = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score)
+        game = random_position(player, opponent, 4)
+        player.get_move(game, countdown(30.))
+        self.assertGreater(player.transporition_table.used, 0)
+        self.assertLessEqual(player.transporition_table.used, 64)
+        self.assertLessEqual(player.transporition_table.cutoffs, player.transporition_table.hits)
+
+        player.new_game()
+        self.assertEqual(player.transporition_table.used, 0)
+
+        # without a call to new_game(), searching an earlier position means a
+        # new game has started
+        player.get_move(game, countdown(30.))
+        self.assertGreater(player.transporition_table.used, 0)
+        player.get_move(random_position(player, opponent, 2), lambda: 1.)
+        self.assertEqual(player.transporition_table.used, 0)
+
+    def test_minimax_ignores_bounds_and_shallow_entries(self):
+        for _ in range(10):
+            player = game_agent.MinimaxPlayer(score_fn=sample_players.improved_score)
+            game = random_position(player, "opponent", random.randint(2, 20))
+            if not game.get_legal_moves():
+                continue
+            # entries an alpha-beta search could leave in a shared table: bounds, and exact scores of
+            # shallower searches
+            table = player.transporition_table
+            for move in game.get_legal_moves():
+                child = game.forecast_move(move)
+                table.store(child.zobrist_key, 5, 1000., game_agent.LOWER_BOUND, (-1, -1))
+                for reply in child.get_legal_moves():
+                    table.store(child.forecast_move(reply).zobrist_key, 0, -1000., game_agent.EXACT, (-1, -1))
+            score, _ = player._minmax(game, 3)
+            self.assertEqual(score, minimax_value(game, player, sample_players.improved_score, 3))
+
+    def test_alphabeta_matches_minimax(self):
+        for _ in range(40):
+            player = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score)
+            player.time_left = lambda: float("inf")
+            game = random_position(player, "opponent", random.randint(2, 20))
+            if not game.get_legal_moves():
+                continue
+            for depth in range(1, 4):
+                expected = minimax_value(game, player, sample_players.improved_score, depth)
+                score, move = player._alphabeta(game, depth)
+                self.assertEqual(score, expected)
+                self.assertIn(move, game.get_legal_moves())
+                # the move is one that reaches the score, not one whose score is only bounded by it
+                game.apply_move(move)
+                self.assertEqual(minimax_value(game, player, sample_players.improved_score, depth - 1), expected)
+                game.undo_move()
+
+    def test_pvs_matches_minimax(self):
+        for _ in range(10):
+            player = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score, search_mode="pvs")
+            player.time_left = lambda: float("inf")
+            game = random_position(player, "opponent", random.randint(2, 20))
+            if not game.get_legal_moves():
+                continue
+            for depth in range(1, 4):
+                expected = minimax_value(game, player, sample_players.improved_score, depth)
+                for guess in (None, expected, expected - 5, expected + 5):
+                    player.transporition_table.clear()
+                    score, move = player.aspiration_search(game, depth, guess)
+                    self.assertEqual(score, expected)
+                    self.assertIn(move, game.get_legal_moves())
+
+        self.assertRaises(ValueError, game_agent.AlphaBetaPlayer, search_mode="unknown")
+
+    def test_mtdf_matches_minimax(self):
+        for _ in range(10):
+            player = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score, search_mode="mtdf")
+            player.time_left = lambda: float("inf")
+            game = random_position(player, "opponent", random.randint(2, 20))
+            if not game.get_legal_moves():
+                continue
+            for depth in range(1, 4):
+                expected = minimax_value(game, player, sample_players.improved_score, depth)
+                for guess in (None, expected, expected - 3.5, expected + 7):
+                    player.transporition_table.clear()
+                    score, move = player.mtdf(game, depth, guess)
+                    self.assertEqual(score, expected)
+                    self.assertIn(move, game.get_legal_moves())
+                    game.apply_move(move)
+                    self.assertEqual(minimax_value(game, player, sample_players.improved_score, depth - 1),
+                                     expected)
+                    game.undo_move()
+
+    def test_deepening_stops_when_exact(self):
+        for search_mode in game_agent.AlphaBetaPlayer.SEARCH_MODES:
+            player = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score,
+                                                search_mode=search_mode, manage_time=False)
+            game = random_position(player, "opponent", 10, width=4, height=4)
+            if game.active_player != player or not game.get_legal_moves():
+                continue
+            # the clock never runs out, so only an exact result ends the search
+            move = player.get_move(game, lambda: float("inf"))
+            self.assertIn(move, game.get_legal_moves())
+            self.assertLessEqual(player.last_depth, len(game.get_blank_spaces()))
+            entry = player.transporition_table.peek(player.get_board_state_key(game))
+            self.assertTrue(entry[0] == game_agent.RESOLVED_DEPTH or abs(entry[1]) == float("inf"))
+
+    def test_partial_results_on_timeout(self):
+        # the clock runs out while searching the second root move of the first pass
+        player = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score)
+        game = isolation.Board(player, "opponent")
+        game.apply_move((3, 3))
+        game.apply_move((0, 0))
+        node_limit(player, 2)
+        self.assertEqual(player.get_move(game, countdown(1000.)), game.get_legal_moves()[0])
+        self.assertEqual(player.last_depth, 0)
+
+        player = game_agent.MinimaxPlayer(search_depth=2, score_fn=sample_players.improved_score)
+        game = isolation.Board(player, "opponent")
+        game.apply_move((3, 3))
+        game.apply_move((0, 0))
+        node_limit(player, 2)
+        self.assertEqual(player.get_move(game, countdown(1000.)), game.get_legal_moves()[0])
+        self.assertEqual(player.transporition_table.used, 1)
+
+    def test_time_manager(self):
+        manager = game_agent.TimeManager(threshold=10.)
+        manager.start(lambda: 110., 5)
+        self.assertEqual(manager.budget, 75.)
+        for _ in range(3):
+            manager.pass_done((1, 2))
+        self.assertEqual(manager.budget, 40.)
+        manager.pass_done((2, 1))
+        self.assertEqual(manager.budget, 100.)
+        manager._pass_times = [1., 10.]
+        self.assertEqual(manager.branching_factor, 10.)
+        self.assertFalse(manager.can_start_pass())
+        self.assertEqual(manager.skipped, 1)
+
+        manager.start(lambda: 110., 2)
+        self.assertEqual(manager.budget, 100.)
+        self.assertTrue(manager.can_start_pass())
+
+        # a single legal move is played without searching
+        player = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score)
+        game = isolation.Board(player, "opponent", width=3, height=3)
+        game.apply_move((0, 0))
+        game.apply_move((1, 2))
+        self.assertEqual(game.get_legal_moves(), [(2, 1)])
+        self.assertEqual(player.get_move(game, lambda: 0.), (2, 1))
+
+    def test_amortized_clock_checks(self):
+        player = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score, manage_time=False)
+        game = isolation.Board(player, "opponent")
+        game.apply_move((3, 3))
+        game.apply_move((0, 0))
+        player.time_left = lambda: 0.
+        player.start_clock()
+        self.assertRaises(game_agent.SearchTimeout, player._alphabeta, game, 5)
+        self.assertEqual(player._nodes, 1)
+
+        # at 10000 nodes per second, a quarter of the 10 ms threshold is 25 nodes
+        player.time_left = lambda: 1000.
+        player.start_clock()
+        player._nodes = 10000
+        player._last_check = (0, timeit.default_timer() - 1.)
+        player.check_clock()
+        self.assertTrue(20 <= player._next_check - player._nodes <= 25)
+
+        # the interval at most doubles from one check to the next
+        player._last_check = (player._nodes - 2, timeit.default_timer() - 1e-6)
+        player.check_clock()
+        self.assertEqual(player._next_check - player._nodes, 4)
+        player.get_move(game, countdown(30.))
+        self.assertGreater(player._nodes, 10000)
+
+        player.check_interval = 7
+        player.time_left = lambda: 1000.
+        player.start_clock()
+        player.check_clock()
+        self.assertEqual(player._next_check, player._nodes + 7)
+
+    def test_pondering(self):
+        player = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score, ponder=True,
+                                            ponder_time=200.)
+        game = isolation.Board(player, "opponent")
+        game.apply_move((3, 3))
+        game.apply_move((0, 0))
+        game.apply_move(player.get_move(game, countdown(50.)))
+
+        # the thread stops by itself after ponder_time
+        player._ponder_thread.join()
+        key, depth, _, _, _ = player._ponder_result
+        replies = [m for m in game.get_legal_moves() if game.forecast_move(m).zobrist_key == key]
+        self.assertEqual(len(replies), 1)
+
+        # the opponent plays the predicted reply, and the search resumes after the pondered depth
+        game.apply_move(replies[0])
+        move = player.get_move(game, countdown(30.))
+        self.assertIn(move, game.get_legal_moves())
+        self.assertGreaterEqual(player.last_depth, depth)
+        player.stop_pondering()
+        self.assertIsNone(player._ponder_thread)
+
+    def test_shared_transposition_table(self):
+        table = shared_table.SharedTranspositionTable(size=5)
+        try:
+            self.assertEqual(table.size, 8)
+            table.store(3, 4, 1.5, game_agent.EXACT, (1, 2))
+            self.assertEqual(table.lookup(3), (4, 1.5, game_agent.EXACT, (1, 2)))
+            self.assertIsNone(table.lookup(11))
+            # same replacement policy as the local table
+            table.store(11, 2, 0.5, game_agent.LOWER_BOUND, (0, 0))
+            table.store(3, 4, 2.5, game_agent.UPPER_BOUND, (0, 1))
+            self.assertEqual(table.peek(3), (4, 1.5, game_agent.EXACT, (1, 2)))
+            table.store(5, game_agent.RESOLVED_DEPTH, float("-inf"), game_agent.EXACT, (-1, -1))
+            self.assertEqual(table.peek(5), (game_agent.RESOLVED_DEPTH, float("-inf"), game_agent.EXACT, (-1, -1)))
+
+            # another handle on the same block sees the entries and the generation
+            other = pickle.loads(pickle.dumps(table))
+            self.assertEqual(other.peek(3), table.peek(3))
+            other.new_search()
+            self.assertEqual(table.generation, 1)
+            table.store(11, 2, 0.5, game_agent.LOWER_BOUND, (0, 0))
+            self.assertEqual(other.peek(11), (2, 0.5, game_agent.LOWER_BOUND, (0, 0)))
+            self.assertEqual(other.used, 2)
+            other.close()
+
+            # an entry torn by a concurrent write reads as a miss
+            offset = shared_table.HEADER.size + (3 & 7) * shared_table.ENTRY.size
+            table._buf[offset + 8] ^= 1
+            self.assertIsNone(table.lookup(3))
+
+            table.clear()
+            self.assertEqual(table.used, 0)
+        finally:
+            table.close()
+
+    def test_players_with_file_table(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "table")
+            for player_class in (game_agent.MinimaxPlayer, game_agent.AlphaBetaPlayer):
+                table = shared_table.SharedTranspositionTable(size=1 << 10, path=path)
+                player = player_class(score_fn=sample_players.improved_score, table=table)
+                self.assertIs(player.transporition_table, table)
+                player.time_left = lambda: float("inf")
+                game = isolation.Board(player, "opponent")
+                for move in [(3, 3), (0, 0), (1, 2), (2, 2)]:
+                    game.apply_move(move)
+                player.new_game()
+                player.start_search(game)
+                player.start_clock()
+                if player_class is game_agent.MinimaxPlayer:
+                    score, _ = player._minmax(game, 3)
+                else:
+                    score, _ = player._alphabeta(game, 3)
+                self.assertEqual(score, minimax_value(game, player, sample_players.improved_score, 3))
+
+                # another process opening the file sees the entries
+                other = pickle.loads(pickle.dumps(table))
+                self.assertIsNone(other.name)
+                self.assertGreater(other.used, 0)
+                self.assertEqual(other.used, table.used)
+                other.close()
+                table.close()
+
+    def test_lazy_smp(self):
+        # a wide timeout margin, as the processes may outnumber the CPUs
+        player = parallel_agent.LazySMPPlayer(score_fn=sample_players.improved_score, timeout=40., workers=2)
+        try:
+            game = isolation.Board(player, "opponent")
+            game.apply_move((3, 3))
+            game.apply_move((0, 0))
+            for _ in range(2):
+                time_left = countdown(150.)
+                move = player.get_move(game, time_left)
+                self.assertGreater(time_left(), 0)
+                self.assertIn(move, game.get_legal_moves())
+                self.assertGreater(player.last_depth, 0)
+                game.apply_move(move)
+                game.apply_move(game.get_legal_moves()[0])
+            self.assertGreater(player.transporition_table.used, 0)
+        finally:
+            player.close()
+        self.assertEqual(player._processes, [])
+
+    def test_root_split(self):
+        player = parallel_agent.RootSplitPlayer(score_fn=sample_players.improved_score, timeout=40.,
+                                                workers=2, split_depth=2)
+        try:
+            player.new_game()
+            pool = player._pool
+            player.time_left = lambda: float("inf")
+            for _ in range(5):
+                game = random_position(player, "opponent", 6)
+                if game.active_player != player or len(game.get_legal_moves()) < 2:
+                    continue
+                player.start_search(game)
+                player.start_clock()
+                score, move = player.search_pass(game, 3)
+                self.assertEqual(score, minimax_value(game, player, sample_players.improved_score, 3))
+                self.assertEqual(score, minimax_value(game.forecast_move(move), player,
+                                                      sample_players.improved_score, 2))
+
+            # the same opening with the seats swapped: the workers must not reuse the scores of the other seat
+            for _ in range(5):
+                moves = []
+                game = isolation.Board(player, "opponent")
+                for _ in range(6):
+                    moves.append(random.choice(game.get_legal_moves()))
+                    game.apply_move(moves[-1])
+                if len(game.get_legal_moves()) < 2:
+                    continue
+                player.new_game()
+                player.start_search(game)
+                player.start_clock()
+                player.search_pass(game, 4)
+
+                swapped = isolation.Board("opponent", player)
+                for move in moves + [random.choice(game.get_legal_moves())]:
+                    swapped.apply_move(move)
+                if len(swapped.get_legal_moves()) < 2:
+                    continue
+                player.new_game()
+                player.start_search(swapped)
+                player.start_clock()
+                score, _ = player.search_pass(swapped, 3)
+                self.assertEqual(score, minimax_value(swapped, player, sample_players.improved_score, 3))
+
+            game = isolation.Board(player, "opponent")
+            game.apply_move((3, 3))
+            game.apply_move((0, 0))
+            for _ in range(2):
+                time_left = countdown(150.)
+                move = player.get_move(game, time_left)
+                self.assertGreater(time_left(), 0)
+                self.assertIn(move, game.get_legal_moves())
+                game.apply_move(move)
+                game.apply_move(game.get_legal_moves()[0])
+            # the pool is started once per player
+            self.assertIs(player._pool, pool)
+        finally:
+            player.close()
+        self.assertIsNone(player._pool)
+
+    def test_mcts(self):
+        player = game_agent.MCTSPlayer()
+        opponent = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score)
+        game = isolation.Board(player, opponent)
+        game.apply_move((3, 3))
+        game.apply_move((0, 0))
+        for turn in range(3):
+            time_left = countdown(150.)
+            move = player.get_move(game, time_left)
+            self.assertGreater(time_left(), 0)
+            self.assertIn(move, game.get_legal_moves())
+            self.assertGreater(player.rollouts, 0)
+            visits = player.visit_counts()
+            self.assertEqual(sorted(visits), sorted(game.get_legal_moves()))
+            self.assertEqual(max(visits, key=visits.get), move)
+            if turn:
+                # the tree is reused along the move played and the reply
+                self.assertGreater(player.reused_visits, 0)
+            game.apply_move(move)
+            game.apply_move(opponent.get_move(game, countdown(150.)))
+
+        # the only move that leaves the opponent without moves wins at once
+        game = isolation.Board(player, "opponent", width=4, height=4)
+        for move in [(1, 3), (0, 2), (2, 1), (2, 3), (3, 3), (1, 1), (1, 2), (3, 2)]:
+            game.apply_move(move)
+        player.new_game()
+        self.assertEqual(player.get_move(game, countdown(50.)), (2, 0))
+
+        # boards with the same number of cells in another shape use their own move tables
+        for width, height in ((4, 6), (6, 4)):
+            player.new_game()
+            game = isolation.Board(player, "opponent", width=width, height=height)
+            game.apply_move((0, 1))
+            game.apply_move((height - 1, width - 1))
+            move = player.get_move(game, countdown(50.))
+            self.assertIn(move, game.get_legal_moves())
+            self.assertEqual(sorted(player.visit_counts()), sorted(game.get_legal_moves()))
+
+    def test_root_parallel_mcts(self):
+        # a wide timeout margin, as the processes may outnumber the CPUs
+        player = parallel_agent.RootParallelMCTSPlayer(timeout=40., workers=2)
+        try:
+            game = isolation.Board(player, "opponent")
+            game.apply_move((3, 3))
+            game.apply_move((0, 0))
+            for _ in range(2):
+                time_left = countdown(150.)
+                move = player.get_move(game, time_left)
+                self.assertGreater(time_left(), 0)
+                self.assertIn(move, game.get_legal_moves())
+                merged = player.merged_visits
+                self.assertEqual(max(merged, key=merged.get), move)
+                # the workers' visits are added to those of the tree of this process
+                own = player.visit_counts()
+                self.assertGreater(sum(merged.values()), sum(own.values()))
+                self.assertEqual(len(player._processes), 2)
+                game.apply_move(move)
+                game.apply_move(game.get_legal_moves()[0])
+        finally:
+            player.close()
+        self.assertEqual(player._processes, [])
+
+    def test_endgame_solver(self):
+        # the players are partitioned: player 1 can make 7 more moves, starting with (3, 4), player 2 only 2
+        moves = [(2, 4), (3, 2), (1, 2), (2, 0), (3, 1), (4, 1), (2, 3), (2, 2), (4, 2), (3, 0)]
+        for board_class in (isolation.Board, isolation.BitBoard):
+            for player_class in (game_agent.MinimaxPlayer, game_agent.AlphaBetaPlayer):
+                player = player_class(score_fn=sample_players.improved_score)
+                game = board_class(player, "opponent", width=5, height=5)
+                for move in moves:
+                    game.apply_move(move)
+                self.assertTrue(game.is_partitioned())
+                self.assertEqual(len(game.longest_path()), 7)
+                self.assertEqual(len(game.longest_path("opponent")), 2)
+
+                self.assertEqual(player.solve_endgame(game), (float("inf"), (3, 4)))
+                self.assertEqual(player.get_move(game, lambda: float("inf")), (3, 4))
+                player.endgame_cells = 10
+                self.assertIsNone(player.solve_endgame(game))
+
+                # the same position is lost for player 2
+                player = player_class(score_fn=sample_players.improved_score)
+                game = board_class("opponent", player, width=5, height=5)
+                for move in moves:
+                    game.apply_move(move)
+                self.assertEqual(player.solve_endgame(game), (float("-inf"), (3, 4)))
+
+    def test_proof_number_search(self):
+        def wins(game):
+            """Reference result for the player to move by plain exhaustive search"""
+            return any(not wins(game.forecast_move(m)) for m in game.get_legal_moves())
+
+        prover = proof_number.ProofNumberSearch(max_entries=1000)
+        for _ in range(30):
+            game = random_position("p1", "p2", random.randint(10, 14), width=5, height=5)
+            if not game.get_legal_moves():
+                continue
+            prover.clear()
+            result, move = prover.prove(game)
+            self.assertEqual(result, wins(game))
+            if result:
+                self.assertFalse(wins(game.forecast_move(move)))
+            else:
+                self.assertEqual(move, (-1, -1))
+            self.assertLessEqual(len(prover), prover.max_entries + prover.nodes)
+
+        # boards with the same number of cells in another shape use their own move tables
+        for width, height in ((4, 6), (6, 4)) * 5:
+            game = random_position("p1", "p2", 14, width=width, height=height)
+            result, move = prover.prove(game)
+            self.assertEqual(result, wins(game))
+            if result:
+                self.assertIn(move, game.get_legal_moves())
+
+        # a table smaller than the tree searched gives the same result, and is trimmed between calls
+        game = random_position("p1", "p2", 22)
+        while not game.get_legal_moves():
+            game = random_position("p1", "p2", 22)
+        unbounded = proof_number.ProofNumberSearch()
+        bounded = proof_number.ProofNumberSearch(max_entries=100)
+        self.assertEqual(bounded.prove(game), unbounded.prove(game))
+        self.assertEqual(bounded.nodes, unbounded.nodes)
+        bounded.prove(game.forecast_move(game.get_legal_moves()[0]))
+        self.assertLessEqual(len(bounded), bounded.max_entries + bounded.nodes)
+
+        # out of nodes on an early position
+        self.assertEqual(prover.prove(random_position("p1", "p2", 2), max_nodes=1), (None, (-1, -1)))
+
+        # a won position is played at once below the threshold
+        moves = [(2, 4), (3, 2), (1, 2), (2, 0), (3, 1), (4, 1), (2, 3), (2, 2), (4, 2), (3, 0)]
+        for pn_threshold in (0, 25):
+            player = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score, endgame_cells=0,
+                                                pn_threshold=pn_threshold)
+            game = isolation.Board(player, "opponent", width=5, height=5)
+            for move in moves:
+                game.apply_move(move)
+            move = player.get_move(game, lambda: float("inf"))
+            self.assertFalse(wins(game.forecast_move(move)))
+            self.assertEqual(player.proven, True if pn_threshold else None)
+
+    def test_tablebase(self):
+        def solve(game):
+            """Reference (<win>, <moves left>) for the player to move by plain exhaustive search"""
+            results = [solve(game.forecast_move(m)) for m in game.get_legal_moves()]
+            if not results:
+                return False, 0
+            wins = [plies for win, plies in results if not win]
+            if wins:
+                return True, 1 + min(wins)
+            return False, 1 + max(plies for _, plies in results)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "5x5.tb")
+            table = tablebase.generate(path, 5, 5, 3)
+            self.assertGreater(len(table), 0)
+            # a pickled tablebase reopens the file
+            table = pickle.loads(pickle.dumps(table))
+
+            probed = 0
+            for _ in range(300):
+                board_class = random.choice((isolation.Board, isolation.BitBoard))
+                game = board_class("p1", "p2", width=5, height=5)
+                for _ in range(random.randint(14, 22)):
+                    if not game.get_legal_moves():
+                        break
+                    game.apply_move(random.choice(game.get_legal_moves()))
+                result = table.probe(game)
+                if result is None:
+                    continue
+                probed += 1
+                self.assertEqual(result, solve(game))
+                move = table.best_move(game)
+                win, plies = result
+                if plies:
+                    self.assertEqual(solve(game.forecast_move(move)), (not win, plies - 1))
+                else:
+                    self.assertEqual(move, (-1, -1))
+            self.assertGreater(probed, 0)
+
+            # positions with too many reachable blank cells, or of another size, are not held
+            self.assertIsNone(table.probe(random_position("p1", "p2", 2, width=5, height=5)))
+            self.assertIsNone(table.probe(random_position("p1", "p2", 40)))
+
+            # a position in the tablebase is played without search
+            player = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score, tablebase=table)
+            game = isolation.Board(player, "opponent", width=5, height=5)
+            while table.probe(game) is None or not game.get_legal_moves() or game.active_player != player:
+                game = random_position(player, "opponent", random.randint(16, 22), width=5, height=5)
+            self.assertEqual(player.get_move(game, lambda: float("inf")), table.best_move(game))
+            self.assertEqual(player._nodes, 0)
+            table.close()
+
+            with open(path, "wb") as f:
+                f.write(b"not a tablebase")
+            with self.assertRaises(ValueError):
+                tablebase.Tablebase(path)
+
+    def test_move_ordering(self):
+        player = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score)
+        game = isolation.Board(player, "opponent")
+        game.apply_move((3, 3))
+        game.apply_move((0, 0))
+        player.start_search(game)
+        legal_moves = game.get_legal_moves()
+        key = player.get_board_state_key(game)
+        pv_move, tt_move, killer, other = legal_moves[-1], legal_moves[-2], legal_moves[-3], legal_moves[0]
+
+        player._pv = [(key, pv_move)]
+        player._record_cutoff_move(0, killer, 3, True)
+        player._history[(True, other)] = 100
+        ordered = player.order_moves(game, list(legal_moves), 0, key, tt_move)
+        self.assertEqual(ordered[:4], [pv_move, tt_move, killer, other])
+        self.assertEqual(sorted(ordered), sorted(legal_moves))
+
+        # the principal variation only applies to the position it was found in
+        ordered = player.order_moves(game, list(legal_moves), 0, key ^ 1)
+        self.assertEqual(ordered[:2], [killer, other])
+
+        player.get_move(game, countdown(30.))
+        self.assertGreater(player.last_depth, 0)
+        self.assertTrue(0 < len(player._pv) <= player.last_depth)
+        self.assertEqual(player._pv[0][0], key)
+
+
+class BoardTest(unittest.TestCase):
+    """Unit tests for the isolation.Board engine"""
+
+    def test_tables_shared_and_complete(self):
+        first = isolation.Board("p1", "p2", width=6, height=5)
+        second = isolation.Board("p1", "p2", width=6, height=5)
+        self.assertIs(first._tables, second._tables)
+
+        tables = isolation.isolation.get_move_tables(6, 5)
+        for idx, (r, c) in enumerate(tables.coords):
+            expected = sorted((r + dr) + (c + dc) * 5
+                              for dr, dc in isolation.isolation.DIRECTIONS
+                              if 0 <= r + dr < 5 and 0 <= c + dc < 6)
+            self.assertEqual(sorted(tables.moves[idx]), expected)
+            self.assertEqual(tables.masks[idx], sum(1 << i for i in expected))
+
+    def test_partition_and_longest_path(self):
+        def longest(game, location, visited):
+            """Reference longest path length by plain depth-first search"""
+            blank = set(game.get_blank_spaces()) - visited
+            lengths = [0]
+            for dr, dc in isolation.isolation.DIRECTIONS:
+                cell = (location[0] + dr, location[1] + dc)
+                if cell in blank:
+                    lengths.append(1 + longest(game, cell, visited | {cell}))
+            return max(lengths)
+
+        partitioned = 0
+        for _ in range(40):
+            for board_class in (isolation.Board, isolation.BitBoard):
+                game = board_class("p1", "p2", width=5, height=5)
+                self.assertFalse(game.is_partitioned())
+                for _ in range(random.randint(2, 14)):
+                    if not game.get_legal_moves():
+                        break
+                    game.apply_move(random.choice(game.get_legal_moves()))
+                for player in ("p1", "p2"):
+                    path = game.longest_path(player)
+                    self.assertEqual(len(path), longest(game, game.get_player_location(player), set()))
+                    # the path is a sequence of knight moves over distinct blank cells
+                    cells = [game.get_player_location(player)] + path
+                    self.assertEqual(len(set(path)), len(path))
+                    self.assertTrue(set(path) <= set(game.get_blank_spaces()))
+                    for (r1, c1), (r2, c2) in zip(cells, cells[1:]):
+                        self.assertIn((r2 - r1, c2 - c1), isolation.isolation.DIRECTIONS)
+
+                blank = set(game.get_blank_spaces())
+                reach = []
+                for player in ("p1", "p2"):
+                    # reference flood fill over the blank cells
+                    frontier, reached = [game.get_player_location(player)], set()
+                    while frontier:
+                        r, c = frontier.pop()
+                        for dr, dc in isolation.isolation.DIRECTIONS:
+                            if (r + dr, c + dc) in blank - reached:
+                                reached.add((r + dr, c + dc))
+                                frontier.append((r + dr, c + dc))
+                    reach.append(reached)
+                self.assertEqual(game.is_partitioned(), not reach[0] & reach[1])
+                partitioned += game.is_partitioned()
+        self.assertGreater(partitioned, 0)
+
+        self.assertRaises(RuntimeError, isolation.Board("p1", "p2").longest_path)
+
+    def test_undo_move(self):
+        for board_class in (isolation.Board, isolation.BitBoard):
+            game = board_class("p1", "p2", width=6, height=6)
+            snapshots = []
+            while game.get_legal_moves():
+                snapshots.append((game.to_string(), game.hash(), game.active_player,
+                                  sorted(game.get_legal_moves())))
+                game.apply_move(random.choice(game.get_legal_moves()))
+
+            while snapshots:
+                game.undo_move()
+                self.assertEqual((game.to_string(), game.hash(), game.active_player,
+                                  sorted(game.get_legal_moves())), snapshots.pop())
+            self.assertEqual(game.move_count, 0)
+            self.assertRaises(RuntimeError, game.undo_move)
+
+    def test_zobrist_key(self):
+        for board_class in (isolation.Board, isolation.BitBoard):
+            game = board_class("p1", "p2", width=5, height=6)
+            keys = isolation.isolation.get_zobrist_keys(5, 6)
+            while game.get_legal_moves():
+                game.apply_move(random.choice(game.get_legal_moves()))
+
+                expected = keys.side if game.active_player == "p2" else 0
+                for r, c in set(itertools.product(range(6), range(5))) - set(game.get_blank_spaces()):
+                    expected ^= keys.cells[r + c * 6]
+                for player, player_keys in (("p1", keys.player_1), ("p2", keys.player_2)):
+                    loc = game.get_player_location(player)
+                    if loc is not None:
+                        expected ^= player_keys[loc[0] + loc[1] * 6]
+                self.assertEqual(game.zobrist_key, expected)
+                self.assertEqual(game.hash(), expected)
+                self.assertEqual(game.copy().zobrist_key, expected)
+
+    def test_count_and_order_of_legal_moves(self):
+        for board_class in (isolation.Board, isolation.BitBoard):
+            game = board_class("p1", "p2")
+            while game.get_legal_moves():
+                for player in ("p1", "p2"):
+                    moves = game.get_legal_moves(player)
+                    self.assertEqual(game.count_legal_moves(player), len(moves))
+                    self.assertEqual(moves, sorted(moves, key=lambda m: m[0] + m[1] * game.height))
+                    self.assertEqual(game.get_legal_moves(player, rng=random.Random(7)),
+                                     game.get_legal_moves(player, rng=random.Random(7)))
+                    self.assertEqual(sorted(game.get_legal_moves(player, rng=random)), sorted(moves))
+                game.apply_move(random.choice(game.get_legal_moves()))
+
+    def test_cached_legal_moves(self):
+        for board_class in (isolation.Board, isolation.BitBoard):
+            game = board_class("p1", "p2", width=5, height=5)
+            game.apply_move((0, 0))
+            game.apply_move((4, 4))
+
+            moves = game.get_legal_moves()
+            moves.append((3, 3))
+            self.assertEqual(game.get_legal_moves(), [(2, 1), (1, 2)])
+            self.assertEqual(game.count_legal_moves(), 2)
+            self.assertFalse(game.is_loser("p1") or game.is_winner("p2"))
+
+            game.copy().apply_move((2, 1))
+            self.assertEqual(game.get_legal_moves(), [(2, 1), (1, 2)])
+
+            while game.count_legal_moves():
+                game.apply_move(game.get_legal_moves()[0])
+            winner, loser = game.inactive_player, game.active_player
+            self.assertEqual(game.get_legal_moves(), [])
+            self.assertTrue(game.is_loser(loser) and game.is_winner(winner))
+            self.assertEqual(game.utility(winner), float("inf"))
+
+            game.undo_move()
+            self.assertEqual(game.utility(winner), 0.)
+            for method in (game.get_legal_moves, game.count_legal_moves, game.get_player_location):
+                with self.assertRaisesRegex(RuntimeError, "not registered"):
+                    method("p3")
+
+    def test_bytes_round_trip(self):
+        for width, height in [(7, 7), (4, 6), (16, 16)]:
+            game = isolation.Board("p1", "p2", width=width, height=height)
+            while True:
+                data = game.to_bytes()
+                self.assertEqual(len(data), len(isolation.Board("p1", "p2", width, height).to_bytes()))
+                for board_class in (isolation.Board, isolation.BitBoard):
+                    restored = board_class.from_bytes(data, "p1", "p2")
+                    self.assertEqual(restored.to_string(), game.to_string())
+                    self.assertEqual(restored.zobrist_key, game.zobrist_key)
+                    self.assertEqual(restored.active_player, game.active_player)
+                    self.assertEqual(restored.move_count, game.move_count)
+                    self.assertEqual(restored.to_bytes(), data)
+                if not game.count_legal_moves():
+                    break
+                game.apply_move(random.choice(game.get_legal_moves()))
+
+        self.assertFalse(hasattr(game, "__dict__"))
+        self.assertRaises(ValueError, isolation.Board.from_bytes, data[:-1], "p1", "p2")
+
+
+class BitBoardTest(unittest.TestCase):
+    """Check that isolation.BitBoard behaves exactly like isolation.Board"""
+
+    def test_matches_board(self):
+        for width, height in [(7, 7), (5, 8), (8, 4)]:
+            for _ in range(5):
+                board = isolation.Board("p1", "p2", width=width, height=height)
+                bitboard = isolation.BitBoard("p1", "p2", width=width, height=height)
+
+                while True:
+                    self.assertEqual(board.to_string(), bitboard.to_string())
+                    self.assertEqual(board.get_blank_spaces(), bitboard.get_blank_spaces())
+                    for player in ("p1", "p2"):
+                        self.assertEqual(board.get_player_location(player),
+                                         bitboard.get_player_location(player))
+                        self.assertEqual(sorted(board.get_legal_moves(player)),
+                                         sorted(bitboard.get_legal_moves(player)))
+                        self.assertEqual(board.utility(player), bitboard.utility(player))
+
+                    legal_moves = board.get_legal_moves()
+                    if not legal_moves:
+                        break
+                    move = random.choice(legal_moves)
+                    self.assertTrue(bitboard.move_is_legal(move))
+                    bitboard = bitboard.forecast_move(move)
+                    board.apply_move(move)
+
+    def test_plays_alpha_beta(self):
+        player1 = game_agent.AlphaBetaPlayer(score_fn=sample_players.improved_score)
+        player2 = sample_players.GreedyPlayer()
+        game = isolation.BitBoard(player1, player2)
+        winner, history, outcome = game.play()
+        self.assertIn(winner, (player1, player2))
+        self.assertEqual(len(history), game.move_count)
+
+    def test_overrides_board_state_readers(self):
+        # BitBoard never allocates `_board_state`, so every Board method that
+        # reads it must be replaced (the private move generator is only
+        # reached through `_legal_moves`)
+        readers = [name for name, attr in vars(isolation.Board).items()
+                   if callable(attr) and name != "_Board__get_moves"
+                   and "_board_state" in inspect.getsource(attr)]
+        self.assertIn("apply_move", readers)
+        for name in readers:
+            self.assertIn(name, vars(isolation.BitBoard), name)
+        self.assertIn("_legal_moves", vars(isolation.BitBoard))
+
+        bitboard = isolation.BitBoard("p1", "p2")
+        self.assertFalse(hasattr(bitboard, "_board_state"))
+
+
 if __name__ == '__main__':
     unittest.main()
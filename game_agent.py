@@ -2,7 +2,17 @@
 test your agent's strength against a set of known agents using tournament.py
 and include the results in your report.
 """
+import functools
+import math
 import random
+import threading
+import time
+
+from array import array
+
+from isolation.isolation import get_move_tables, mask_cells, position_masks
+from proof_number import ProofNumberSearch
+
 
 class SearchTimeout(Exception):
     """Subclass base exception for code clarity. """
@@ -11,6 +21,7 @@ class SearchTimeout(Exception):
 
 def custom_score_timer(func):
     #import time
+    @functools.wraps(func)
     def inner(game, player):
         #start_time = time.time()
         result = func(game, player)
@@ -59,14 +70,14 @@ def custom_score(game, player):
     if game.is_winner(player):
         return float("inf")
 
-    own_moves = game.get_legal_moves(player)
+    own_moves = game.count_legal_moves(player)
     opp_moves = game.get_legal_moves(game.get_opponent(player)) 
 
-    if len(own_moves) != 0 and len(opp_moves) == 0:
+    if own_moves != 0 and len(opp_moves) == 0:
         return float("inf")
-    elif len(own_moves) == 0 and len(opp_moves) != 0:
+    elif own_moves == 0 and len(opp_moves) != 0:
         return float("-inf")
-    elif len(own_moves) == 0 and len(opp_moves) == 0:
+    elif own_moves == 0 and len(opp_moves) == 0:
         return -10 
 
     score = 0.0 
@@ -90,7 +101,7 @@ def custom_score(game, player):
     score += player_center_weight * (1.0 - euclidean_distance/max_distance)  
 
     ## incentives having more moves than the opponent 
-    score += weight_moves_difference_weight * float(len(own_moves))/float(len(opp_moves)) 
+    score += weight_moves_difference_weight * float(own_moves)/float(len(opp_moves)) 
 
     ## incentives pushing the opponent towards the edge
     def is_on_edge(pos):
@@ -149,14 +160,14 @@ def custom_score_2(game, player):
     if game.is_winner(player):
         return float("inf")
 
-    own_moves = game.get_legal_moves(player)
-    opp_moves = game.get_legal_moves(game.get_opponent(player))
+    own_moves = game.count_legal_moves(player)
+    opp_moves = game.count_legal_moves(game.get_opponent(player))
 
-    if len(own_moves) != 0 and len(opp_moves) == 0:
+    if own_moves != 0 and opp_moves == 0:
         return float("inf")
-    elif len(own_moves) == 0 and len(opp_moves) != 0:
+    elif own_moves == 0 and opp_moves != 0:
         return float("-inf")
-    elif len(own_moves) == 0 and len(opp_moves) == 0:
+    elif own_moves == 0 and opp_moves == 0:
         return -10 
 
     player_current_pos = game.get_player_location(player)
@@ -164,7 +175,7 @@ def custom_score_2(game, player):
 
     max_distance = game.width + game.height 
 
-    score = float(len(own_moves) - len(opp_moves)) 
+    score = float(own_moves - opp_moves) 
     
     target_distance = 2 + 1 ## knight move 
 
@@ -207,20 +218,212 @@ def custom_score_3(game, player):
     if game.is_winner(player):
         return float("inf")
 
-    own_moves = game.get_legal_moves(player)
-    opp_moves = game.get_legal_moves(game.get_opponent(player))
+    own_moves = game.count_legal_moves(player)
+    opp_moves = game.count_legal_moves(game.get_opponent(player))
 
-    if len(own_moves) != 0 and len(opp_moves) == 0:
+    if own_moves != 0 and opp_moves == 0:
         return float("inf")
-    elif len(own_moves) == 0 and len(opp_moves) != 0:
+    elif own_moves == 0 and opp_moves != 0:
         return float("-inf")
-    elif len(own_moves) == 0 and len(opp_moves) == 0:
+    elif own_moves == 0 and opp_moves == 0:
         return -10 
 
-    if len(own_moves) >= len(opp_moves):
-        return (len(own_moves) / len(opp_moves)) ** 2.0 
+    if own_moves >= opp_moves:
+        return (own_moves / opp_moves) ** 2.0 
     else:
-        return -(len(opp_moves) / len(own_moves)) ** 2.0
+        return -(opp_moves / own_moves) ** 2.0
+
+
+# bound types stored with transposition table scores
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# upper bound on the number of nodes searched between two clock checks
+MAX_CHECK_INTERVAL = 4096
+
+# depth stored with the score of a subtree that was searched to the end of the
+# game on every line, which no deeper search can change
+RESOLVED_DEPTH = 1 << 30
+
+
+class TranspositionTable:
+    """Fixed-size cache of search results keyed by the Zobrist key of a
+    position, shared by the minimax and alphabeta agents.
+
+    Each slot holds one entry `(depth, score, bound, move)`: the depth of the
+    search below the position, its score, whether the score is EXACT, a
+    LOWER_BOUND or an UPPER_BOUND of the true value, and the best move found.
+    A position maps to the slot `key % size`. A new result replaces the
+    entry in its slot, for the same position or a colliding one, unless the
+    entry was stored during the current search (see new_search()) and is
+    either deeper, or as deep and EXACT while the new result is only a
+    bound; entries stored by earlier searches are aged out and replaced.
+
+    `hits` counts the lookups that found an entry for the position, while
+    `cutoffs` counts the entries the search could actually use in place of
+    searching the position (recorded by the search through record_cutoff()).
+
+    Parameters
+    ----------
+    size : int (optional)
+        Number of slots, rounded up to a power of two. The memory used by the
+        table is bounded by the number of slots (roughly 150 bytes each when
+        full).
+    """
+    def __init__(self, size=1 << 16):
+        self.size = 1 << max(0, size - 1).bit_length()
+        self._mask = self.size - 1
+        self.probes = 0
+        self.hits = 0
+        self.cutoffs = 0
+        self.clear()
+
+    def lookup(self, key):
+        """ return the entry (depth, score, bound, move) stored for the position key, or None """
+        self.probes += 1
+        idx = key & self._mask
+        if self._keys[idx] == key:
+            self.hits += 1
+            return self._entries[idx]
+        return None
+
+    def peek(self, key):
+        """ return the entry stored for the position key, or None, without counting the lookup """
+        idx = key & self._mask
+        if self._keys[idx] == key:
+            return self._entries[idx]
+        return None
+
+    def record_cutoff(self):
+        """ count an entry returned by lookup() that was deep and tight enough to replace a search """
+        self.cutoffs += 1
+
+    def store(self, key, depth, score, bound, move):
+        """ store a search result, unless the slot holds a more valuable result of the current search,
+            whether for the same position or another one
+        """
+        idx = key & self._mask
+        entry = self._entries[idx]
+        if entry is None:
+            self.used += 1
+        elif self._ages[idx] == self.generation and (
+                entry[0] > depth or (entry[0] == depth and entry[2] == EXACT and bound != EXACT)):
+            return
+        self._keys[idx] = key
+        self._entries[idx] = (depth, score, bound, move)
+        self._ages[idx] = self.generation
+
+    def new_search(self):
+        """ start a new search; entries stored by earlier searches stay available but are replaced
+            first when slots collide
+        """
+        self.generation += 1
+
+    def clear(self):
+        """ remove all entries; the lookup statistics are kept """
+        self._keys = [None] * self.size
+        self._entries = [None] * self.size
+        self._ages = [0] * self.size
+        self.generation = 0
+        self.used = 0
+
+    @property
+    def occupancy(self):
+        """ fraction of the slots holding an entry """
+        return self.used / float(self.size)
+
+    @property
+    def hit_rate(self):
+        """ fraction of lookups that found an entry for the position since the table was created """
+        return self.hits / float(self.probes) if self.probes else 0.
+
+    @property
+    def cutoff_rate(self):
+        """ fraction of lookups whose entry replaced a search since the table was created """
+        return self.cutoffs / float(self.probes) if self.probes else 0.
+
+
+class TimeManager:
+    """Budget the time of a turn between the passes of an iterative deepening
+    search.
+
+    The budget of a turn is a fraction of the time left before the timeout
+    threshold: all of it for critical moves (the best move changed in the
+    last pass, or only a few legal moves), `normal_fraction` of it otherwise,
+    and `stable_fraction` of it once the best move has stayed the same for
+    `stable_passes` passes in a row. A new pass is only started when its
+    predicted time -- the time of the last pass multiplied by the effective
+    branching factor measured between the last two passes -- fits in what is
+    left of the budget.
+
+    Parameters
+    ----------
+    threshold : float (optional)
+        Time (in milliseconds) to keep in reserve before the turn times out.
+
+    normal_fraction : float (optional)
+        Fraction of the available time budgeted for an ordinary move.
+
+    stable_fraction : float (optional)
+        Fraction of the available time budgeted once the best move is stable.
+
+    stable_passes : int (optional)
+        Number of passes in a row with the same best move for it to be stable.
+
+    critical_moves : int (optional)
+        Positions with at most this many legal moves get the whole budget.
+    """
+    def __init__(self, threshold=10., normal_fraction=0.75, stable_fraction=0.4, stable_passes=3,
+                 critical_moves=2):
+        self.threshold = threshold
+        self.normal_fraction = normal_fraction
+        self.stable_fraction = stable_fraction
+        self.stable_passes = stable_passes
+        self.critical_moves = critical_moves
+        self.skipped = 0
+        self.start(lambda: 0., 0)
+
+    def start(self, time_left, num_legal_moves):
+        """ start budgeting a turn of time_left() milliseconds with the given number of legal moves """
+        self._start = time.perf_counter()
+        self.available = time_left() - self.threshold
+        self._critical = num_legal_moves <= self.critical_moves
+        self.budget = self.available if self._critical else self.available * self.normal_fraction
+        self._pass_times = []
+        self._best_moves = []
+
+    def elapsed(self):
+        """ milliseconds spent since the start of the turn """
+        return 1000. * (time.perf_counter() - self._start)
+
+    def pass_done(self, best_move):
+        """ record a completed search pass and its best move, and update the budget of the turn """
+        self._pass_times.append(self.elapsed() - sum(self._pass_times))
+        self._best_moves.append(best_move)
+
+        recent = self._best_moves[-self.stable_passes:]
+        if self._critical or (len(recent) > 1 and recent[-1] != recent[-2]):
+            self.budget = self.available
+        elif len(recent) == self.stable_passes and len(set(recent)) == 1:
+            self.budget = self.available * self.stable_fraction
+        else:
+            self.budget = self.available * self.normal_fraction
+
+    @property
+    def branching_factor(self):
+        """ effective branching factor: ratio between the times of the last two passes (at least 1) """
+        if len(self._pass_times) < 2 or self._pass_times[-2] <= 0:
+            return 1.
+        return max(1., self._pass_times[-1] / self._pass_times[-2])
+
+    def can_start_pass(self):
+        """ test whether the next pass is predicted to complete within the budget of the turn """
+        predicted = self._pass_times[-1] * self.branching_factor if self._pass_times else 0.
+        if self.elapsed() + predicted <= self.budget:
+            return True
+        self.skipped += 1
+        return False
 
 
 class IsolationPlayer:
@@ -244,25 +447,112 @@ class IsolationPlayer:
         Time remaining (in milliseconds) when search is aborted. Should be a
         positive value large enough to allow the function to return before the
         timer expires.
+
+    table_size : int (optional)
+        Number of slots in the transposition table, which caps its memory use.
+
+    table : object (optional)
+        Transposition table to use instead of a new `TranspositionTable` of
+        `table_size` slots, e.g. a `shared_table.SharedTranspositionTable`
+        shared with other processes; it must expose the same interface, and
+        is cleared by new_game() like the default table.
+
+    endgame_cells : int (optional)
+        Number of blank cells from which the search solves partitioned
+        positions exactly (see solve_endgame()); the exact solver is
+        exponential in the size of the regions, so this bounds its cost.
     """
-    def __init__(self, search_depth=3, score_fn=custom_score, timeout=10.):
+    def __init__(self, search_depth=3, score_fn=custom_score, timeout=10., table_size=1 << 16, table=None,
+                 endgame_cells=18):
         self.search_depth = search_depth
         self.score = score_fn
         self.time_left = None
         self.TIMER_THRESHOLD = timeout
         """ 
-        used to cache scores for game board states to avoid recomputing, key will be the hash of the board and 
-        value a tuple (<score>, <[moves]>)
+        used to cache scores for game board states to avoid recomputing, key will be the Zobrist key of the 
+        board and entries a tuple (<depth>, <score>, <bound>, <move>); cleared at the start of every game
         """
-        self.transporition_table = {} 
+        self.transporition_table = table if table is not None else TranspositionTable(table_size)
+        self.endgame_cells = endgame_cells
         """ used to store the time to run the assigned evaluation function """
         self.time_logging = []
+        """ best root move among those fully searched by the current (possibly interrupted) search pass """
+        self._partial_move = None
+        """ move count of the root position of the current search """
+        self._root_move_count = 0
+        """ move count of the last position searched, used to detect the start of a new game """
+        self._last_move_count = None
+        """ nodes searched between two clock checks; calibrated from the measured node rate if None """
+        self.check_interval = None
+        """ deadline of the current search on the time.perf_counter() clock (see start_clock) """
+        self._deadline = math.inf
+        """ number of nodes searched, the node count of the next clock check and the (<nodes>, <time>) of the last """
+        self._nodes = 0
+        self._next_check = 0
+        self._last_check = (0, 0.)
+
+    def new_game(self):
+        """ reset the per-game search state; the game harness should call this before each game """
+        self.transporition_table.clear()
+
+    def start_search(self, game):
+        """ prepare the per-move search state before searching the given position; as a fallback for
+            harnesses that never call new_game(), a position no later than the last one searched is
+            taken to start a new game
+        """
+        if self._last_move_count is None or game.move_count <= self._last_move_count:
+            self.new_game()
+        self._last_move_count = game.move_count
+        self.transporition_table.new_search()
+
+    def start_clock(self):
+        """ turn time_left() into a deadline on the time.perf_counter() clock, so that the search only needs
+            to compare the clock with it every few nodes (see check_clock); the clock is checked at the
+            next node
+        """
+        now = time.perf_counter()
+        self._deadline = now + (self.time_left() - self.TIMER_THRESHOLD) / 1000.
+        self._next_check = self._nodes + 1
+        self._last_check = (self._nodes, now)
+
+    def check_clock(self):
+        """ raise SearchTimeout once the deadline has passed, otherwise schedule the next check; unless
+            check_interval is set, the interval is calibrated from the node rate measured since the last
+            check so that about a quarter of TIMER_THRESHOLD elapses between checks, and at most doubles
+            from one check to the next so that a burst of fast nodes cannot delay a check too much
+        """
+        now = time.perf_counter()
+        if now >= self._deadline:
+            raise SearchTimeout()
+
+        interval = self.check_interval
+        if interval is None:
+            nodes, then = self._last_check
+            rate = (self._nodes - nodes) / (now - then) if now > then else 0.
+            interval = int(rate * self.TIMER_THRESHOLD / 4000.)
+            interval = max(1, min(interval, 2 * (self._nodes - nodes), MAX_CHECK_INTERVAL))
+        self._last_check = (self._nodes, now)
+        self._next_check = self._nodes + interval
 
     def get_board_state_key(self, board):
         """ return a board state key that will be used as a key for the transporition_table 
-            when caching its score 
+            when caching its score; each player owns its table and scores positions from its
+            own perspective, so the Zobrist key of the position is enough
+        """
+        return board.zobrist_key
+
+    def solve_endgame(self, game):
+        """ return a tuple (<score>, <move>) with the proven score of the position for this player (+inf or
+            -inf) and the first move of the longest path of the active player, once the players are
+            partitioned and at most endgame_cells cells are blank; None otherwise. The active player runs
+            out of moves first unless its longest path is strictly longer than the opponent's
         """
-        return board.hash() 
+        if game.width * game.height - game.move_count > self.endgame_cells or not game.is_partitioned():
+            return None
+        path = game.longest_path(game.active_player)
+        active_wins = len(path) > len(game.longest_path(game.inactive_player))
+        score = math.inf if active_wins == (game.active_player == self) else -math.inf
+        return score, path[0] if path else (-1, -1)
 
     def is_game_won(self, game_state):
         """ test if a player has won the game, called by the search methods to test whether to terminate the 
@@ -306,6 +596,7 @@ class MinimaxPlayer(IsolationPlayer):
             (-1, -1) if there are no available legal moves.
         """
         self.time_left = time_left
+        self.start_search(game)
 
         # Initialize the best move so that this function returns something
         # in case the search fails due to timeout
@@ -317,7 +608,9 @@ class MinimaxPlayer(IsolationPlayer):
             return self.minimax(game, self.search_depth)
 
         except SearchTimeout:
-            pass  # Handle any actions required after timeout as needed
+            # keep the best of the root moves that were fully searched before the timeout
+            if self._partial_move is not None:
+                best_move = self._partial_move
 
         # Return the best move from the last completed search iteration
         return best_move
@@ -363,12 +656,15 @@ class MinimaxPlayer(IsolationPlayer):
         """
         if self.time_left() < self.TIMER_THRESHOLD:
             raise SearchTimeout()
+        self.start_clock()
 
         legal_moves = game.get_legal_moves()
 
         if not legal_moves:
             return (-1, -1)
 
+        self._partial_move = None
+        self._root_move_count = game.move_count
         _, move = self._minmax(game, depth)
 
         return move
@@ -376,8 +672,14 @@ class MinimaxPlayer(IsolationPlayer):
     def _minmax(self, game_state, depth):
         """ min and max algorithm 
         """
-        if self.time_left() < self.TIMER_THRESHOLD:
-            raise SearchTimeout()
+        # the clock is only read every check_interval nodes
+        self._nodes += 1
+        if self._nodes >= self._next_check:
+            self.check_clock()
+
+        solved = self.solve_endgame(game_state)
+        if solved is not None:
+            return solved
         
         is_max = game_state.active_player == self
 
@@ -389,26 +691,24 @@ class MinimaxPlayer(IsolationPlayer):
         legal_moves = game_state.get_legal_moves()              
 
         for m in legal_moves:
-            next_game_state = game_state.forecast_move(m)    
-            next_game_state_key = self.get_board_state_key(next_game_state)        
-
-            if depth == 1 or self.is_game_won(next_game_state):
-                # do we have it cached?                 
-                if  next_game_state_key in self.transporition_table:                    
-                    score = self.transporition_table[next_game_state_key][0]
-                else:                     
-                    score = self.score(next_game_state, self)
-                    # cache score and move 
-                    #self.transporition_table[next_game_state_key] = (score, m)
-            else:
-                if  next_game_state_key in self.transporition_table:
-                    score, move = self.transporition_table[next_game_state_key]
+            # apply the move in place and revert it once the child is scored
+            game_state.apply_move(m)
+            try:
+                next_game_state_key = self.get_board_state_key(game_state)
+                entry = self.transporition_table.lookup(next_game_state_key)
+
+                # the table may be shared with alpha-beta searches, whose bounds are no minimax scores
+                if entry is not None and entry[0] >= depth - 1 and entry[2] == EXACT:
+                    self.transporition_table.record_cutoff()
+                    score = entry[1]
+                elif depth == 1 or self.is_game_won(game_state):
+                    score = self.score(game_state, self)
                 else:
-                    try:
-                        score, move = self._minmax(next_game_state, depth-1)
-                        self.transporition_table[next_game_state_key] = (score, move)
-                    except SearchTimeout:
-                        break 
+                    # a timeout unwinds the whole search, so only complete results are cached
+                    score, move = self._minmax(game_state, depth-1)
+                    self.transporition_table.store(next_game_state_key, depth-1, score, EXACT, move)
+            finally:
+                game_state.undo_move()
 
             # first score or new best score? 
             if best_score is None or ((is_max and score > best_score) or (not is_max and score < best_score)):
@@ -422,6 +722,9 @@ class MinimaxPlayer(IsolationPlayer):
             elif best_score == score:
                 best_moves.append(m)
 
+            if game_state.move_count == self._root_move_count:
+                self._partial_move = best_moves[0]
+
         return best_score, random.choice(best_moves) if len(best_moves) > 0 else (-1,-1)    
 
 
@@ -429,12 +732,106 @@ class AlphaBetaPlayer(IsolationPlayer):
     """Game-playing agent that chooses a move using iterative deepening minimax
     search with alpha-beta pruning. You must finish and test this player to
     make sure it returns a good move before the search time limit expires.
+
+    Moves are searched in order of the principal variation of the previous
+    iteration, the transposition table move, the killer moves of the ply and
+    then by decreasing history score; `order_by_mobility` additionally breaks
+    history ties by the mobility left to the opponent after each move.
+
+    `search_mode` selects the search run by each iterative deepening pass:
+    "alphabeta" searches every move with the full window, while "pvs" runs a
+    principal variation search (null-window probes for all but the first
+    move of each node) inside an aspiration window of +/- `aspiration_window`
+    around the score of the previous pass, searching again with the failing
+    side opened up when the score falls outside of it. "mtdf" converges on
+    the score with a sequence of zero-window searches in the MTD(f) style,
+    starting from the score of the previous pass and relying on the
+    transposition table to avoid searching the same nodes again.
+
+    Deepening stops as soon as a pass is exact: when it proves a win or a
+    loss, or when no node was cut off by the depth limit. With `manage_time`
+    a TimeManager also stops it before passes that are not expected to
+    complete in the budget of the turn, and a single legal move is played at
+    once.
+
+    With a `pn_threshold`, positions with at most that many blank cells are
+    first given to a proof-number search (see proof_number.py) of at most
+    `pn_nodes` nodes: a proven win is played at once, without spending the
+    rest of the turn on alpha-beta, and the positions it solved are kept for
+    the following moves of the game.
+
+    With a `tablebase` (see tablebase.py), positions it holds are played
+    from it without any search.
+
+    With `ponder`, the player keeps searching in a background thread after
+    returning a move, for up to `ponder_time` milliseconds: it searches the
+    position after the opponent reply predicted by the transposition table,
+    or the position after its own move (so all replies) without prediction.
+    The next call to get_move() stops the thread and resumes the search from
+    the pondered depth when the opponent played the predicted reply; the
+    transposition table filled while pondering helps in any case. Pondering
+    threads share the interpreter lock, so they only gain time when the
+    opponent runs in another process: under Board.play(), where both agents
+    share one process, pondering slows the opponent down and can make it
+    time out.
     """
 
-    def __init__(self, search_depth=11, score_fn=custom_score, timeout=10.):
+    SEARCH_MODES = ("alphabeta", "pvs", "mtdf")
+
+    def __init__(self, search_depth=11, score_fn=custom_score, timeout=10., table_size=1 << 16,
+                 order_by_mobility=False, search_mode="alphabeta", aspiration_window=2., manage_time=True,
+                 ponder=False, ponder_time=1000., table=None, endgame_cells=18, pn_threshold=0,
+                 pn_nodes=5000, tablebase=None):
         """ Override the constructor to set the search depth 
         """
-        IsolationPlayer.__init__(self, search_depth=search_depth, score_fn=score_fn, timeout=timeout)
+        IsolationPlayer.__init__(self, search_depth=search_depth, score_fn=score_fn, timeout=timeout,
+                                 table_size=table_size, table=table, endgame_cells=endgame_cells)
+        if search_mode not in self.SEARCH_MODES:
+            raise ValueError("Unknown search mode {!r}, expected one of {}".format(
+                search_mode, ", ".join(self.SEARCH_MODES)))
+        self.search_mode = search_mode
+        self.aspiration_window = aspiration_window
+        self.time_manager = TimeManager(timeout) if manage_time else None
+        self.order_by_mobility = order_by_mobility
+        self.pn_threshold = pn_threshold
+        self.pn_nodes = pn_nodes
+        """ proof-number search run before alpha-beta in late positions, and its result for the last position """
+        self.prover = ProofNumberSearch()
+        self.proven = None
+        self.tablebase = tablebase
+        """ principal variation of the last completed iteration, a list of (<key>, <move>) per ply """
+        self._pv = []
+        """ up to two moves per ply (relative to the root) that caused a cutoff in the current search """
+        self._killers = []
+        """ cutoff counts weighted by depth squared, keyed by (<is max node>, <move>) """
+        self._history = {}
+        """ depth of the last completed iterative deepening pass """
+        self.last_depth = 0
+        """ number of nodes scored at the depth limit (rather than at the end of the game) in the current pass """
+        self._horizon_nodes = 0
+        self.ponder = ponder
+        self.ponder_time = ponder_time
+        """ pondering thread, and the result (<key>, <depth>, <score>, <move>, <exact>) of its last pass """
+        self._ponder_thread = None
+        self._ponder_result = None
+
+    def new_game(self):
+        """ reset the per-game search state, including the history table and any pondering """
+        self.stop_pondering()
+        IsolationPlayer.new_game(self)
+        self._history = {}
+        self.prover.clear()
+
+    def start_search(self, game):
+        """ reset the per-move ordering state; history scores decay by half between moves so that they
+            follow the game
+        """
+        IsolationPlayer.start_search(self, game)
+        self._pv = []
+        self._killers = []
+        self._root_move_count = game.move_count
+        for move in self._history:
+            self._history[move] //= 2
 
     def get_move(self, game, time_left):
         """Search for the best move from the available legal moves and return a
@@ -466,27 +863,87 @@ class AlphaBetaPlayer(IsolationPlayer):
             Board coordinates corresponding to a legal move; may return
             (-1, -1) if there are no available legal moves.
         """
+        pondered = self.stop_pondering()
+        move = self.iterative_deepening(game, time_left, pondered)
+        if self.ponder and move != (-1, -1):
+            self.start_pondering(game, move)
+        return move
+
+    def iterative_deepening(self, game, time_left, pondered=None):
+        """ search the position with increasingly deep passes until the time runs out or the result is
+            exact, resuming from a pondering result (<key>, <depth>, <score>, <move>, <exact>) for the
+            same position if given
+        """
         self.time_left = time_left
-            
+        self.start_search(game)
+        self.start_clock()
+
         legal_moves = game.get_legal_moves()
 
         if not legal_moves:
             return (-1, -1)
 
+        time_manager = self.time_manager
+        if time_manager is not None:
+            if len(legal_moves) == 1:
+                return legal_moves[0]
+            time_manager.start(time_left, len(legal_moves))
+
+        if self.tablebase is not None:
+            tablebase_move = self.tablebase.best_move(game)
+            if tablebase_move is not None:
+                return tablebase_move
+        proven_move = self.prove_win(game)
+        if proven_move is not None:
+            return proven_move
+
         best_move = (-1, -1)     
+        score = None
 
         current_depth = 1 
+        if pondered is not None and pondered[0] == self.get_board_state_key(game) and pondered[3] in legal_moves:
+            # the opponent played the predicted reply, so the pondered passes need not be searched again
+            _, self.last_depth, score, best_move, exact = pondered
+            if exact:
+                return best_move
+            self._pv = self.principal_variation(game, self.last_depth)
+            current_depth = self.last_depth + 1
+
         while True:
+            self._horizon_nodes = 0
+            self._partial_move = None
             try:
-                best_move = self.alphabeta(game, current_depth)                 
+                score, best_move = self.search_pass(game, current_depth, score)
             except SearchTimeout: 
+                # the first root move searched is the best move of the previous pass, so the best of the
+                # root moves fully searched at the interrupted depth is at least as good
+                if self._partial_move is not None:
+                    return self._partial_move
                 return best_move
 
+            self.last_depth = current_depth
+            if self.search_is_exact(score):
+                return best_move
+            if time_manager is not None:
+                time_manager.pass_done(best_move)
+                if not time_manager.can_start_pass():
+                    return best_move
+            self._pv = self.principal_variation(game, current_depth)
             current_depth += 1
         
         return best_move   
 
 
+    def prove_win(self, game):
+        """ return a winning move proven by the proof-number search if the position has at most pn_threshold
+            blank cells, or None; the result of the search (True, False or None) is kept in proven
+        """
+        self.proven = None
+        if game.width * game.height - game.move_count > self.pn_threshold:
+            return None
+        self.proven, move = self.prover.prove(game, self.pn_nodes, self._deadline)
+        return move if self.proven else None
+
     def alphabeta(self, game, depth, alpha=float("-inf"), beta=float("inf")):
         """Implement depth-limited minimax search with alpha-beta pruning as
         described in the lectures.
@@ -532,49 +989,549 @@ class AlphaBetaPlayer(IsolationPlayer):
                 each helper function or else your agent will timeout during
                 testing.
         """        
+        if self.time_left() < self.TIMER_THRESHOLD:
+            raise SearchTimeout()
+        self.start_clock()
+
         _, move = self._alphabeta(game, depth, alpha, beta) 
         return move 
               
     def _alphabeta(self, game, depth, alpha=float("-inf"), beta=float("inf")):
-
-        if self.time_left() < self.TIMER_THRESHOLD:
-            raise SearchTimeout()
+        """ fail-soft alpha-beta search returning a tuple (<score>, <move>); results are cached in the
+            transposition table with the bound type implied by the (alpha, beta) window
+        """
+        # the clock is only read every check_interval nodes
+        self._nodes += 1
+        if self._nodes >= self._next_check:
+            self.check_clock()
+
+        if depth == 0 or not game.count_legal_moves():
+            if depth == 0 and game.count_legal_moves():
+                solved = self.solve_endgame(game)
+                if solved is not None:
+                    return solved
+                self._horizon_nodes += 1
+            return self.score(game, self), (-1, -1)
+
+        key = self.get_board_state_key(game)
+        entry = self.transporition_table.lookup(key)
+        tt_move = None
+
+        if entry is not None:
+            entry_depth, entry_score, bound, tt_move = entry
+            if entry_depth >= depth and (bound == EXACT or
+                                         (bound == LOWER_BOUND and entry_score >= beta) or
+                                         (bound == UPPER_BOUND and entry_score <= alpha)):
+                self.transporition_table.record_cutoff()
+                if entry_depth != RESOLVED_DEPTH:
+                    self._horizon_nodes += 1
+                return entry_score, tt_move
+
+        # once the players are partitioned, the game is solved without searching the subtree
+        solved = self.solve_endgame(game)
+        if solved is not None:
+            self.transporition_table.store(key, RESOLVED_DEPTH, solved[0], EXACT, solved[1])
+            return solved
+
+        # a subtree adding no horizon nodes is resolved, and its score holds for any depth
+        horizon_nodes = self._horizon_nodes
+
+        ply = game.move_count - self._root_move_count
+        legal_moves = self.order_moves(game, game.get_legal_moves(), ply, key, tt_move)
+
+        alpha_orig, beta_orig = alpha, beta
 
         best_score  = None
         best_move  = (-1,-1)
 
-        best_moves = [best_move]
-
-        legal_moves = game.get_legal_moves()        
-
         is_max = game.active_player == self
+        pvs = self.search_mode == "pvs"
+        # only the scores of a full window root search are exact, and so comparable across root moves
+        track_partial = ply == 0 and alpha == -math.inf and beta == math.inf
 
         for m in legal_moves:
-            next_game_state = game.forecast_move(m)            
-
-            if depth == 1 or self.is_game_won(next_game_state):
-                score = self.score(next_game_state, self)
-            else:
-                score, _ = self._alphabeta(next_game_state, depth-1, alpha, beta)
+            # apply the move in place and revert it once the child is scored
+            game.apply_move(m)
+            try:
+                if pvs and best_score is not None:
+                    # probe with a null window whether the move improves on the best one so far, and
+                    # only search it again with the full window if it does
+                    if is_max:
+                        score, _ = self._alphabeta(game, depth-1, alpha, math.nextafter(alpha, math.inf))
+                    else:
+                        score, _ = self._alphabeta(game, depth-1, math.nextafter(beta, -math.inf), beta)
+                    if alpha < score < beta:
+                        score, _ = self._alphabeta(game, depth-1, alpha, beta)
+                else:
+                    score, _ = self._alphabeta(game, depth-1, alpha, beta)
+            finally:
+                game.undo_move()
 
+            # only a strictly better score replaces the best move: once alpha (or beta) is the best score, a
+            # later move returning the same score failed low (or high), so it may well be worse
             if best_score is None or ((is_max and score > best_score) or (not is_max and score < best_score)):
                 best_score = score 
                 best_move = m 
 
-                best_moves = [m]
+                if track_partial:
+                    self._partial_move = m
 
                 if is_max:                    
                     if best_score >= beta:
-                        return best_score, random.choice(best_moves)
+                        self._record_cutoff_move(ply, m, depth, is_max)
+                        break
                     # update alpha for alpha-beta pruning 
                     alpha = max(alpha, best_score)                    
                 else:                    
                     if best_score <= alpha:
-                        return best_score, random.choice(best_moves)
+                        self._record_cutoff_move(ply, m, depth, is_max)
+                        break
                     # update beta for alpha-beta pruning 
                     beta = min(beta, best_score)                    
 
-            elif best_score == score:
-                best_moves.append(m)            
+        if best_score <= alpha_orig:
+            bound = UPPER_BOUND
+        elif best_score >= beta_orig:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        if self._horizon_nodes == horizon_nodes:
+            depth = RESOLVED_DEPTH
+        self.transporition_table.store(key, depth, best_score, bound, best_move)
+
+        return best_score, best_move
+
+    def search_pass(self, game, depth, score=None):
+        """ run one iterative deepening pass of the configured search mode, given the score of the
+            previous pass; returns a tuple (<score>, <move>)
+        """
+        if self.search_mode == "pvs":
+            return self.aspiration_search(game, depth, score)
+        elif self.search_mode == "mtdf":
+            return self.mtdf(game, depth, score)
+        return self._alphabeta(game, depth)
+
+    def start_pondering(self, game, move):
+        """ start searching in a background thread the position expected after the given move and the
+            predicted reply of the opponent
+        """
+        next_game = game.forecast_move(move)
+        entry = self.transporition_table.peek(self.get_board_state_key(next_game))
+        if entry is not None and entry[3] in next_game.get_legal_moves():
+            next_game.apply_move(entry[3])
+        if not next_game.count_legal_moves():
+            return
+
+        # prepare the search state here, so that stop_pondering() can never be overtaken by the thread
+        self.transporition_table.new_search()
+        self._pv = []
+        self._killers = []
+        self._root_move_count = next_game.move_count
+        now = time.perf_counter()
+        self._deadline = now + self.ponder_time / 1000.
+        self._next_check = self._nodes + 1
+        self._last_check = (self._nodes, now)
+        self._ponder_result = None
+        self._ponder_thread = threading.Thread(target=self._ponder, args=(next_game,), daemon=True)
+        self._ponder_thread.start()
+
+    def stop_pondering(self):
+        """ stop the pondering thread, if any, and return the result of its last completed pass or None """
+        thread = self._ponder_thread
+        if thread is None:
+            return None
+        # the thread raises SearchTimeout at its next clock check
+        self._deadline = -math.inf
+        thread.join()
+        self._ponder_thread = None
+        result, self._ponder_result = self._ponder_result, None
+        return result
+
+    def _ponder(self, game):
+        """ pondering thread: deepen the search of the position until stopped or exact """
+        key = self.get_board_state_key(game)
+        score = None
+        depth = 1
+        try:
+            while True:
+                self._horizon_nodes = 0
+                score, move = self.search_pass(game, depth, score)
+                exact = self.search_is_exact(score)
+                self._ponder_result = (key, depth, score, move, exact)
+                if exact:
+                    return
+                self._pv = self.principal_variation(game, depth)
+                depth += 1
+        except SearchTimeout:
+            pass
+
+    def search_is_exact(self, score):
+        """ test whether the last search pass returned an exact score that no deeper search can change:
+            a proven win or loss, or a search that reached the end of the game on every line
+        """
+        return math.isinf(score) or self._horizon_nodes == 0
+
+    def aspiration_search(self, game, depth, guess=None):
+        """ search the position with a window of +/- aspiration_window around the guessed score
+            (typically the score of the previous iteration), searching again with the failing side of
+            the window opened up until the score falls inside it; returns a tuple (<score>, <move>)
+        """
+        if guess is None or math.isinf(guess):
+            return self._alphabeta(game, depth)
+
+        alpha, beta = guess - self.aspiration_window, guess + self.aspiration_window
+        while True:
+            score, move = self._alphabeta(game, depth, alpha, beta)
+            if score <= alpha and alpha > -math.inf:
+                alpha = -math.inf
+            elif score >= beta and beta < math.inf:
+                beta = math.inf
+            else:
+                return score, move
+
+    def mtdf(self, game, depth, guess=None):
+        """ find the score of the position with zero-window searches, narrowing the bounds around the
+            guessed score (the static score of the position if None) until they meet; returns a tuple
+            (<score>, <move>) with the move from the last search that proved the bound of the side to move
+            (the lower bound when it is this player's turn, the upper bound otherwise)
+        """
+        if guess is None:
+            guess = self.score(game, self)
+
+        is_max = game.active_player == self
+        lower, upper = -math.inf, math.inf
+        score = guess
+        best_move = None
+        while lower < upper:
+            # scores are floats, so the zero window lies between beta and the float just below it
+            beta = max(score, math.nextafter(lower, math.inf))
+            score, move = self._alphabeta(game, depth, math.nextafter(beta, -math.inf), beta)
+            if score < beta:
+                upper = score
+            else:
+                lower = score
+            if (score >= beta) == is_max:
+                best_move = move
+        return score, best_move if best_move is not None else move
+
+    def order_moves(self, game, legal_moves, ply, key, tt_move=None):
+        """ return the legal moves in search order: the principal variation move (while the search
+            follows the principal variation), the transposition table move, the killer moves of the
+            ply, then the other moves by decreasing history score
+        """
+        first = []
+        if ply < len(self._pv) and self._pv[ply][0] == key:
+            first.append(self._pv[ply][1])
+        if tt_move is not None:
+            first.append(tt_move)
+        if ply < len(self._killers):
+            first.extend(self._killers[ply])
+
+        ordered = []
+        for m in first:
+            if m in legal_moves and m not in ordered:
+                ordered.append(m)
+        rest = [m for m in legal_moves if m not in ordered]
 
-        return best_score, random.choice(best_moves)
\ No newline at end of file
+        is_max = game.active_player == self
+        history = self._history
+        if self.order_by_mobility:
+            def mobility(m):
+                game.apply_move(m)
+                try:
+                    return game.count_legal_moves()
+                finally:
+                    game.undo_move()
+            rest.sort(key=lambda m: (-history.get((is_max, m), 0), mobility(m)))
+        else:
+            rest.sort(key=lambda m: -history.get((is_max, m), 0))
+
+        return ordered + rest
+
+    def principal_variation(self, game, depth):
+        """ return the principal variation from the given position as a list of (<key>, <move>) pairs,
+            following the best moves stored in the transposition table for up to depth plies
+        """
+        pv = []
+        try:
+            for _ in range(depth):
+                key = self.get_board_state_key(game)
+                entry = self.transporition_table.peek(key)
+                if entry is None or entry[3] not in game.get_legal_moves():
+                    break
+                pv.append((key, entry[3]))
+                game.apply_move(entry[3])
+        finally:
+            for _ in pv:
+                game.undo_move()
+        return pv
+
+    def _record_cutoff_move(self, ply, move, depth, is_max):
+        """ remember a move that caused a cutoff as a killer move of its ply and in the history table """
+        while len(self._killers) <= ply:
+            self._killers.append([])
+        killers = self._killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        self._history[(is_max, move)] = self._history.get((is_max, move), 0) + depth * depth
+
+
+class MCTSPlayer(IsolationPlayer):
+    """Game-playing agent that chooses a move using Monte Carlo tree search
+    with the UCT selection rule and uniformly random rollouts.
+
+    The search runs on a compact copy of the position: an integer mask of
+    the blocked cells and the cell index of each player, so that a rollout
+    only costs a few integer operations per move. The move played is the
+    most visited one. The tree is kept between moves: the next call to
+    get_move() continues from the node of the position reached by the move
+    played and the reply of the opponent, when the tree holds it.
+
+    Nodes are indices into flat arrays (`array.array`) rather than objects,
+    so the tree holds no objects for the garbage collector to scan; with
+    tens of thousands of node objects, its full collections would take
+    longer than the timeout margin. The children of a node are stored
+    together when the node is expanded, on its second visit.
+
+    Parameters
+    ----------
+    timeout : float (optional)
+        Time remaining (in milliseconds) when search is aborted.
+
+    exploration : float (optional)
+        Exploration constant of the UCT rule.
+
+    reuse_tree : bool (optional)
+        Keep the tree between moves; if False, each move starts a new tree.
+
+    max_nodes : int (optional)
+        Number of nodes above which the tree stops growing; a tree this
+        large is dropped at the next move rather than reused.
+    """
+    def __init__(self, timeout=10., exploration=math.sqrt(2), reuse_tree=True, max_nodes=1 << 19):
+        IsolationPlayer.__init__(self, timeout=timeout, table_size=1)
+        self.exploration = exploration
+        self.reuse_tree = reuse_tree
+        self.max_nodes = max_nodes
+        """ number of rollouts run by the last call to get_move(), and visits of the root reused from the last """
+        self.rollouts = 0
+        self.reused_visits = 0
+        """ search tree: per node the move leading to it (a cell index), its visits, the rollouts won by the
+            player who made the move, and the index and number of its children (-1 and 0 until expanded)
+        """
+        self._moves = self._visits = self._wins = self._first_child = self._child_count = None
+        """ root node and its position as a tuple (<blocked mask>, <location to move>, <other location>) """
+        self._root = None
+        self._root_state = None
+        """ (<width>, <height>) of the board being played, its move tables and mask of all cells, and the
+            list of cell indices of each mask of knight moves
+        """
+        self._board_size = None
+        self._tables = None
+        self._full_mask = 0
+        self._move_lists = {}
+
+    def new_game(self):
+        """ reset the per-game search state, dropping the search tree """
+        IsolationPlayer.new_game(self)
+        self._root = None
+        self._root_state = None
+
+    @property
+    def node_count(self):
+        """ number of nodes in the search tree, including those no longer reachable from the root """
+        return len(self._moves) if self._root is not None else 0
+
+    def get_move(self, game, time_left):
+        """Search for the best move from the available legal moves and return a
+        result before the time limit expires.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            An instance of `isolation.Board` encoding the current state of the
+            game (e.g., player locations and blocked cells).
+
+        time_left : callable
+            A function that returns the number of milliseconds left in the
+            current turn. Returning with any less than 0 ms remaining forfeits
+            the game.
+
+        Returns
+        -------
+        (int, int)
+            Board coordinates corresponding to a legal move; may return
+            (-1, -1) if there are no available legal moves.
+        """
+        self.time_left = time_left
+        self.start_clock()
+        return self.search(game)
+
+    def search(self, game):
+        """ grow the tree of the position until the deadline of the search (see start_clock) and return the
+            most visited move, or (-1, -1) if there are no legal moves
+        """
+        legal_moves = game.get_legal_moves()
+        if not legal_moves:
+            return (-1, -1)
+
+        state = self._game_state(game)
+        root = self._find_root(state) if self.reuse_tree and self.node_count < self.max_nodes else None
+        if root is None:
+            root = self._new_tree()
+        self._root, self._root_state = root, state
+        self.reused_visits = self._visits[root]
+
+        rollouts = 0
+        deadline = self._deadline
+        while time.perf_counter() < deadline:
+            self._iterate(root, state)
+            rollouts += 1
+        self.rollouts = rollouts
+
+        first, count = self._first_child[root], self._child_count[root]
+        if not count:
+            return legal_moves[0]
+        best = max(range(first, first + count), key=self._visits.__getitem__)
+        return self._tables.coords[self._moves[best]]
+
+    def visit_counts(self):
+        """ return the number of visits of each move from the root of the last search, keyed by (row, col) """
+        if self._root is None:
+            return {}
+        first = self._first_child[self._root]
+        return {self._tables.coords[self._moves[child]]: self._visits[child]
+                for child in range(first, first + self._child_count[self._root])}
+
+    def _new_tree(self):
+        """ drop the search tree and return the root node of a new one """
+        typecode = "b" if self._full_mask.bit_length() <= 127 else "h"
+        self._moves = array(typecode, [-1])
+        self._visits = array("l", [0])
+        self._wins = array("l", [0])
+        self._first_child = array("l", [-1])
+        self._child_count = array("h", [0])
+        return 0
+
+    def _iterate(self, root, state):
+        """ run one select, expand, simulate and backpropagate iteration from the root """
+        moves, visits, wins = self._moves, self._visits, self._wins
+        first_child, child_count = self._first_child, self._child_count
+        exploration = self.exploration
+        occupied, loc, other_loc = state
+        node = root
+        path = [root]
+        while True:
+            first = first_child[node]
+            if first < 0:
+                # a leaf: simulate from it on its first visit, expand it on the next one
+                if not visits[node] or len(moves) >= self.max_nodes:
+                    break
+                first = self._expand(node, occupied, loc)
+            count = child_count[node]
+            if not count:
+                break
+
+            # selection: an unvisited child, or the child with the highest UCT value
+            log_visits = math.log(visits[node])
+            best, best_value = first, -1.
+            for child in range(first, first + count):
+                child_visits = visits[child]
+                if not child_visits:
+                    best = child
+                    break
+                value = wins[child] / child_visits + exploration * math.sqrt(log_visits / child_visits)
+                if value > best_value:
+                    best, best_value = child, value
+            node = best
+            move = moves[node]
+            occupied |= 1 << move
+            loc, other_loc = other_loc, move
+            path.append(node)
+            if not visits[node]:
+                break
+
+        # simulation, then backpropagation from the perspective of the player who moved into each node
+        reward = 1 - self._rollout(occupied, loc, other_loc)
+        for node in reversed(path):
+            visits[node] += 1
+            wins[node] += reward
+            reward = 1 - reward
+
+    def _expand(self, node, occupied, loc):
+        """ add the children of a node for the legal moves of the player at loc; returns the first child """
+        legal_moves = self._legal_moves(occupied, loc)
+        first = len(self._moves)
+        count = len(legal_moves)
+        self._moves.extend(legal_moves)
+        self._visits.extend([0] * count)
+        self._wins.extend([0] * count)
+        self._first_child.extend([-1] * count)
+        self._child_count.extend([0] * count)
+        self._first_child[node] = first
+        self._child_count[node] = count
+        return first
+
+    def _rollout(self, occupied, loc, other_loc):
+        """ play random moves from the given position to the end of the game; returns 1 if the player to
+            move at the start wins, 0 otherwise
+        """
+        masks = self._tables.masks
+        move_lists = self._move_lists
+        choice = random.choice
+        turn = 0
+        while True:
+            if loc is None:
+                moves = mask_cells(self._full_mask & ~occupied)
+            else:
+                mask = masks[loc] & ~occupied
+                moves = move_lists.get(mask)
+                if moves is None:
+                    moves = move_lists[mask] = mask_cells(mask)
+            if not moves:
+                # the player to move loses
+                return turn
+            move = choice(moves)
+            occupied |= 1 << move
+            loc, other_loc = other_loc, move
+            turn ^= 1
+
+    def _legal_moves(self, occupied, loc):
+        """ return the cell indices of the legal moves of the player at loc (None before its first move) """
+        if loc is None:
+            return mask_cells(self._full_mask & ~occupied)
+        return mask_cells(self._tables.masks[loc] & ~occupied)
+
+    def _game_state(self, game):
+        """ return the position of the game as a tuple (<blocked mask>, <location to move>, <other location>)
+            of cell indices, setting up the move tables for its board size
+        """
+        if self._board_size != (game.width, game.height):
+            # boards with the same number of cells in another shape have other move tables
+            self._board_size = (game.width, game.height)
+            self._tables = get_move_tables(game.width, game.height)
+            self._full_mask = (1 << (game.width * game.height)) - 1
+            self._move_lists = {}
+            self._root = self._root_state = None
+        blank, loc, other_loc = position_masks(game)
+        return self._full_mask & ~blank, loc, other_loc
+
+    def _find_root(self, state):
+        """ return the node of the tree for the given position, reached from the last root by at most a
+            move and a reply, or None if the tree does not hold it
+        """
+        if self._root is None:
+            return None
+        if state == self._root_state:
+            return self._root
+        occupied = self._root_state[0]
+        moves, first_child, child_count = self._moves, self._first_child, self._child_count
+        first = first_child[self._root]
+        for child in range(first, first + child_count[self._root]):
+            child_first = first_child[child]
+            for grandchild in range(child_first, child_first + child_count[child]):
+                move, reply = moves[child], moves[grandchild]
+                if state == (occupied | 1 << move | 1 << reply, move, reply):
+                    return grandchild
+        return None
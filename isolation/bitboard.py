@@ -0,0 +1,319 @@
+"""
+This file contains the `BitBoard` class, an alternative engine for the game
+Isolation that keeps the blocked cells in an integer bitmask instead of a list
+of cells, and generates knight moves by masking the precomputed move tables.
+
+`BitBoard` is a drop-in replacement for `isolation.Board`: it accepts the same
+constructor arguments, exposes the same public methods, and returns moves and
+locations in the same (row, column) format, so any agent written against
+`Board` can play on a `BitBoard` unchanged.
+
+Cell (row, column) is stored in bit `row + column * height`, which is the same
+index `Board` uses for its state list.
+"""
+from .isolation import Board, get_move_tables, get_zobrist_keys, _new_state, _pack_state
+
+# cache of the move lists for each (width, height) board size, mapping a mask
+# of knight destinations to the list of its (row, column) pairs
+_MOVE_LISTS = {}
+
+
+class BitBoard(Board):
+    """Implement a model for the game Isolation on integer bitmasks, assuming
+    each player moves like a knight in chess.
+
+    The full game state is a mask of blocked cells plus the cell index of
+    each player (NOT_MOVED while the player has not moved). The player
+    holding initiative follows from `active_player`.
+
+    Legal moves are never cached per position: the mask of a player's moves
+    is one AND away, and the list of (row, column) pairs for each distinct
+    mask is built once and shared by every board of the same size.
+
+    `BitBoard` extends `Board` so that it inherits the player bookkeeping
+    and `play()`, but it overrides every method that reads the `Board`
+    state array (`_board_state`), which it never allocates.
+
+    Parameters
+    ----------
+    player_1 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    player_2 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    width : int (optional)
+        The number of columns that the board should have.
+
+    height : int (optional)
+        The number of rows that the board should have.
+    """
+
+    __slots__ = ("_full_mask", "_occupied", "_p1_loc", "_p2_loc", "_move_lists")
+
+    def __init__(self, player_1, player_2, width=7, height=7):
+        self.width = width
+        self.height = height
+        self.move_count = 0
+        self._player_1 = player_1
+        self._player_2 = player_2
+        self._active_player = player_1
+        self._inactive_player = player_2
+
+        self._tables = get_move_tables(width, height)
+        self._zobrist_keys = get_zobrist_keys(width, height)
+        self._zobrist_key = 0
+        self._full_mask = (1 << (width * height)) - 1
+        self._occupied = 0
+        self._p1_loc = Board.NOT_MOVED
+        self._p2_loc = Board.NOT_MOVED
+        self._move_lists = _MOVE_LISTS.setdefault((width, height), {})
+        self._undo_stack = []
+        self._moves_cache = None
+
+    def hash(self):
+        return self._zobrist_key
+
+    def copy(self):
+        """ Return a deep copy of the current board. The copy starts with an
+        empty undo history.
+        """
+        new_board = BitBoard.__new__(BitBoard)
+        new_board.width = self.width
+        new_board.height = self.height
+        new_board.move_count = self.move_count
+        new_board._player_1 = self._player_1
+        new_board._player_2 = self._player_2
+        new_board._active_player = self._active_player
+        new_board._inactive_player = self._inactive_player
+        new_board._tables = self._tables
+        new_board._zobrist_keys = self._zobrist_keys
+        new_board._zobrist_key = self._zobrist_key
+        new_board._full_mask = self._full_mask
+        new_board._occupied = self._occupied
+        new_board._p1_loc = self._p1_loc
+        new_board._p2_loc = self._p2_loc
+        new_board._move_lists = self._move_lists
+        new_board._undo_stack = []
+        new_board._moves_cache = None
+        return new_board
+
+    def to_bytes(self):
+        """Serialize the game state, without the player objects, using the
+        same encoding as Board.to_bytes().
+        """
+        state = _new_state(self.width, self.height)
+        occupied = self._occupied
+        while occupied:
+            low = occupied & -occupied
+            state[low.bit_length() - 1] = 1
+            occupied ^= low
+        state[-3] = int(self._active_player == self._player_2)
+        if self._p2_loc != Board.NOT_MOVED:
+            state[-2] = self._p2_loc + 1
+        if self._p1_loc != Board.NOT_MOVED:
+            state[-1] = self._p1_loc + 1
+        return _pack_state(self.width, self.height, self.move_count, state)
+
+    def move_is_legal(self, move):
+        """Test whether a move is legal in the current game state.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+
+        Returns
+        -------
+        bool
+            Returns True if the move is legal, False otherwise
+        """
+        return (0 <= move[0] < self.height and 0 <= move[1] < self.width and
+                not self._occupied >> (move[0] + move[1] * self.height) & 1)
+
+    def get_blank_spaces(self):
+        """Return a list of the locations that are still available on the board.
+        """
+        return self._cells(self._full_mask & ~self._occupied)
+
+    def get_legal_moves(self, player=None, rng=None):
+        """Return the list of all legal moves for the specified player.
+
+        Parameters
+        ----------
+        player : object (optional)
+            An object registered as a player in the current game. If None,
+            return the legal moves for the active player on the board.
+
+        rng : random.Random (optional)
+            A random number generator (or the `random` module) used to
+            shuffle the moves. If None, the moves are returned in a fixed
+            order (increasing cell index).
+
+        Returns
+        -------
+        list<(int, int)>
+            The list of coordinate pairs (row, column) of all legal moves
+            for the player constrained by the current game state.
+        """
+        if player is None:
+            player = self.active_player
+        valid_moves = list(self._legal_moves(player))
+        if rng is not None:
+            rng.shuffle(valid_moves)
+        return valid_moves
+
+    def count_legal_moves(self, player=None):
+        """Return the number of legal moves for the specified player without
+        building the list of moves.
+
+        Parameters
+        ----------
+        player : object (optional)
+            An object registered as a player in the current game. If None,
+            count the legal moves for the active player on the board.
+
+        Returns
+        -------
+        int
+            The number of legal moves available to the player.
+        """
+        return self._moves_mask(player).bit_count()
+
+    def apply_move(self, move):
+        """Move the active player to a specified location.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+        """
+        idx = move[0] + move[1] * self.height
+        zobrist_keys = self._zobrist_keys
+        if self._active_player == self._player_1:
+            prev_loc, player_keys = self._p1_loc, zobrist_keys.player_1
+            self._p1_loc = idx
+        else:
+            prev_loc, player_keys = self._p2_loc, zobrist_keys.player_2
+            self._p2_loc = idx
+        self._undo_stack.append((idx, prev_loc, self._zobrist_key))
+
+        self._zobrist_key ^= zobrist_keys.cells[idx] ^ player_keys[idx] ^ zobrist_keys.side
+        if prev_loc != Board.NOT_MOVED:
+            self._zobrist_key ^= player_keys[prev_loc]
+        self._occupied |= 1 << idx
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        self.move_count += 1
+
+    def undo_move(self):
+        """Revert the last move applied in place by apply_move(), restoring
+        the previous location of the player that made it and the initiative.
+        """
+        if not self._undo_stack:
+            raise RuntimeError("There are no moves to undo on this board.")
+        idx, prev_loc, self._zobrist_key = self._undo_stack.pop()
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        if self._active_player == self._player_1:
+            self._p1_loc = prev_loc
+        else:
+            self._p2_loc = prev_loc
+        self._occupied &= ~(1 << idx)
+        self.move_count -= 1
+
+    def to_string(self, symbols=['1', '2']):
+        """Generate a string representation of the current game state, marking
+        the location of each player and indicating which cells have been
+        blocked, and which remain open.
+        """
+        col_margin = len(str(self.height - 1)) + 1
+        prefix = "{:<" + "{}".format(col_margin) + "}"
+        offset = " " * (col_margin + 3)
+        out = offset + '   '.join(map(str, range(self.width))) + '\n\r'
+        for i in range(self.height):
+            out += prefix.format(i) + ' | '
+            for j in range(self.width):
+                idx = i + j * self.height
+                if not self._occupied >> idx & 1:
+                    out += ' '
+                elif self._p1_loc == idx:
+                    out += symbols[0]
+                elif self._p2_loc == idx:
+                    out += symbols[1]
+                else:
+                    out += '-'
+                out += ' | '
+            out += '\n\r'
+
+        return out
+
+    def _legal_moves(self, player):
+        """Return the legal moves of the specified player. The list is shared
+        with the move list cache and must not be modified.
+        """
+        loc = self._player_loc(player)
+        if loc is None:
+            return self._cells(self._full_mask & ~self._occupied)
+        # knight destinations form at most 8 bits per cell, so the cache of
+        # move lists stays small; opening moves (any blank cell) bypass it
+        mask = self._tables.masks[loc] & ~self._occupied
+        moves = self._move_lists.get(mask)
+        if moves is None:
+            moves = self._move_lists[mask] = self._cells(mask)
+        return moves
+
+    def _blank_mask(self):
+        """Return the mask of blank cells."""
+        return self._full_mask & ~self._occupied
+
+    def _location_index(self, player):
+        """Return the cell index of the specified player, or NOT_MOVED if the
+        player has not been placed on the board yet.
+        """
+        return self._p2_loc if self._player_slot(player) else self._p1_loc
+
+    def _restore_state(self, move_count, state):
+        """Replace the game state with a decoded board state array."""
+        self.move_count = move_count
+        self._occupied = sum(1 << idx for idx in range(self.width * self.height) if state[idx])
+        self._p1_loc = state[-1] - 1 if state[-1] else Board.NOT_MOVED
+        self._p2_loc = state[-2] - 1 if state[-2] else Board.NOT_MOVED
+        if state[-3]:
+            self._active_player, self._inactive_player = self._player_2, self._player_1
+        self._zobrist_key = self._compute_zobrist_key()
+
+    def _player_loc(self, player):
+        """Return the cell index of the specified player (or the active player
+        if None), without the index lookup of `_player_slot()`.
+        """
+        if player is None:
+            player = self._active_player
+        if player == self._player_1:
+            return self._p1_loc
+        if player == self._player_2:
+            return self._p2_loc
+        return self._location_index(player)  # raises for unknown players
+
+    def _moves_mask(self, player):
+        """Return the mask of cells the specified player (or the active
+        player if None) can legally move to.
+        """
+        loc = self._player_loc(player)
+        if loc is None:
+            return self._full_mask & ~self._occupied
+        return self._tables.masks[loc] & ~self._occupied
+
+    def _cells(self, mask):
+        """Convert a mask of cells into a list of (row, column) pairs in
+        increasing index order.
+        """
+        coords = self._tables.coords
+        cells = []
+        while mask:
+            low = mask & -mask
+            cells.append(coords[low.bit_length() - 1])
+            mask ^= low
+        return cells
@@ -8,11 +8,186 @@ remain compatible with the defaults provided, and none of your changes will
 be available to project reviewers.
 """
 import random
+import struct
+import sys
 import timeit
-from copy import copy
+from array import array
+from collections import namedtuple
 
 TIME_LIMIT_MILLIS = 150
 
+# header of the serialized board: width, height and move count
+STATE_HEADER = struct.Struct("<HHH")
+
+# knight moves as (row offset, column offset) pairs
+DIRECTIONS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+              (1, -2), (1, 2), (2, -1), (2, 1)]
+
+# seed for the Zobrist keys; fixed so that hashes agree across processes
+ZOBRIST_SEED = 0x150A710
+
+MoveTables = namedtuple("MoveTables", ["moves", "masks", "coords"])
+ZobristKeys = namedtuple("ZobristKeys", ["cells", "player_1", "player_2", "side"])
+
+# cache of the knight move tables for each (width, height) board size
+_MOVE_TABLES = {}
+
+# cache of the Zobrist keys for each (width, height) board size
+_ZOBRIST_KEYS = {}
+
+
+def get_move_tables(width, height):
+    """Return the knight move tables for a board of the given size. The
+    tables are built on first use and shared by every board of that size.
+
+    Cells are indexed as `row + column * height`.
+
+    Returns
+    -------
+    MoveTables
+        `moves[idx]` is the sorted list of cell indices a knight on cell
+        `idx` can reach without leaving the board, `masks[idx]` is the same set of
+        cells as a bitmask, and `coords[idx]` is the (row, column) pair of
+        cell `idx`.
+    """
+    key = (width, height)
+    if key not in _MOVE_TABLES:
+        coords = [(idx % height, idx // height) for idx in range(width * height)]
+        moves = []
+        for r, c in coords:
+            moves.append(sorted((r + dr) + (c + dc) * height for dr, dc in DIRECTIONS
+                                if 0 <= r + dr < height and 0 <= c + dc < width))
+        masks = [sum(1 << idx for idx in cell_moves) for cell_moves in moves]
+        _MOVE_TABLES[key] = MoveTables(moves, masks, coords)
+    return _MOVE_TABLES[key]
+
+
+def get_zobrist_keys(width, height):
+    """Return the random 64-bit keys used to hash boards of the given size.
+    The keys are drawn from a generator with a fixed seed, so every process
+    computes the same hash for the same position.
+
+    Returns
+    -------
+    ZobristKeys
+        `cells[idx]` marks cell `idx` as blocked, `player_1[idx]` and
+        `player_2[idx]` mark the location of each player, and `side` marks
+        that player 2 holds the initiative.
+    """
+    key = (width, height)
+    if key not in _ZOBRIST_KEYS:
+        rng = random.Random(ZOBRIST_SEED + 1000 * width + height)
+        size = width * height
+        cells = [rng.getrandbits(64) for _ in range(size)]
+        player_1 = [rng.getrandbits(64) for _ in range(size)]
+        player_2 = [rng.getrandbits(64) for _ in range(size)]
+        _ZOBRIST_KEYS[key] = ZobristKeys(cells, player_1, player_2, rng.getrandbits(64))
+    return _ZOBRIST_KEYS[key]
+
+
+def _new_state(width, height):
+    """Return a zeroed board state array for a board of the given size. The
+    cells are stored as bytes unless the board is too large for a cell index
+    to fit in one.
+    """
+    typecode = "B" if width * height < 255 else "H"
+    return array(typecode, [0]) * (width * height + 3)
+
+
+def _pack_state(width, height, move_count, state):
+    """Serialize a board state array with its header. Multi-byte cells are
+    written little-endian so the bytes can be read on any machine.
+    """
+    if state.itemsize > 1 and sys.byteorder == "big":
+        state = array(state.typecode, state)
+        state.byteswap()
+    return STATE_HEADER.pack(width, height, move_count) + state.tobytes()
+
+
+def _unpack_state(data):
+    """Parse the output of _pack_state() into a tuple (width, height,
+    move_count, state).
+    """
+    width, height, move_count = STATE_HEADER.unpack_from(data)
+    state = _new_state(width, height)
+    body = bytes(data[STATE_HEADER.size:])
+    if len(body) != len(state) * state.itemsize:
+        raise ValueError("Invalid board encoding: expected {} bytes of state for a {}x{} board, got {}."
+                         .format(len(state) * state.itemsize, width, height, len(body)))
+    state = array(state.typecode)
+    state.frombytes(body)
+    if state.itemsize > 1 and sys.byteorder == "big":
+        state.byteswap()
+    return width, height, move_count, state
+
+
+# cache of longest knight path lengths for each (width, height) board size,
+# keyed by (cell index, mask of the blank cells reachable from it); each cache
+# is cleared once it holds more than MAX_PATH_CACHE entries
+_PATH_LENGTHS = {}
+MAX_PATH_CACHE = 1 << 18
+
+
+def mask_cells(mask):
+    """Return the list of the cell indices set in `mask`, lowest first."""
+    cells = []
+    while mask:
+        low = mask & -mask
+        cells.append(low.bit_length() - 1)
+        mask ^= low
+    return cells
+
+
+def position_masks(game):
+    """Return the position of a game as a tuple (blank, loc, other_loc) of
+    the mask of the blank cells and the cell indices of the active and the
+    inactive player, indexed like `get_move_tables()`; a player that has not
+    moved yet has index None.
+    """
+    return (game._blank_mask(), game._location_index(game.active_player),
+            game._location_index(game.inactive_player))
+
+
+def reachable_mask(masks, loc, free):
+    """Return the mask of the cells in `free` that a knight on cell `loc`
+    can reach by a sequence of moves over cells in `free`, using the
+    `masks` move table of `get_move_tables()`.
+    """
+    reached = 0
+    frontier = masks[loc] & free
+    while frontier:
+        reached |= frontier
+        targets = 0
+        while frontier:
+            low = frontier & -frontier
+            targets |= masks[low.bit_length() - 1]
+            frontier ^= low
+        frontier = targets & free & ~reached
+    return reached
+
+
+def longest_path_length(masks, loc, free, cache):
+    """Return the number of moves in a longest knight path from cell `loc`
+    over the cells in `free`, each visited at most once.
+
+    The search is exhaustive, with results memoized in `cache` per start cell
+    and region (the cells reachable from it), and stops early on a path
+    through the whole region.
+    """
+    region = reachable_mask(masks, loc, free)
+    key = (loc, region)
+    length = cache.get(key)
+    if length is None:
+        length = 0
+        size = region.bit_count()
+        moves = masks[loc] & region
+        while moves and length < size:
+            low = moves & -moves
+            length = max(length, 1 + longest_path_length(masks, low.bit_length() - 1, region ^ low, cache))
+            moves ^= low
+        cache[key] = length
+    return length
+
 
 class Board(object):
     """Implement a model for the game Isolation assuming each player moves like
@@ -37,6 +212,10 @@ class Board(object):
     BLANK = 0
     NOT_MOVED = None
 
+    __slots__ = ("width", "height", "move_count", "_player_1", "_player_2",
+                 "_active_player", "_inactive_player", "_tables", "_zobrist_keys",
+                 "_zobrist_key", "_board_state", "_undo_stack", "_moves_cache")
+
     def __init__(self, player_1, player_2, width=7, height=7):
         self.width = width
         self.height = height
@@ -45,15 +224,35 @@ class Board(object):
         self._player_2 = player_2
         self._active_player = player_1
         self._inactive_player = player_2
+        self._tables = get_move_tables(width, height)
+        self._zobrist_keys = get_zobrist_keys(width, height)
+        self._zobrist_key = 0
 
         # The last 3 entries of the board state includes initiative (0 for
-        # player 1, 1 for player 2) player 2 last move, and player 1 last move
-        self._board_state = [Board.BLANK] * (width * height + 3)
-        self._board_state[-1] = Board.NOT_MOVED
-        self._board_state[-2] = Board.NOT_MOVED
+        # player 1, 1 for player 2) player 2 last move, and player 1 last move;
+        # moves are stored as cell index + 1, so 0 means the player has not
+        # moved yet
+        self._board_state = _new_state(width, height)
+
+        # Each entry records the cell index, the previous location of the
+        # player that moved, the initiative, the Zobrist key and the legal
+        # move cache for a move applied in place
+        self._undo_stack = []
+
+        # Legal moves of player 1 and player 2 in the current state, computed
+        # on first use; the lists are shared and must never be modified
+        self._moves_cache = [None, None]
 
     def hash(self):
-        return str(self._board_state).__hash__()
+        return self._zobrist_key
+
+    @property
+    def zobrist_key(self):
+        """A 64-bit Zobrist hash of the current game state, covering the
+        blocked cells, both player locations and the player holding
+        initiative. The key is updated incrementally by apply_move().
+        """
+        return self._zobrist_key
 
     @property
     def active_player(self):
@@ -91,14 +290,69 @@ class Board(object):
         raise RuntimeError("`player` must be an object registered as a player in the current game.")
 
     def copy(self):
-        """ Return a deep copy of the current board. """
-        new_board = Board(self._player_1, self._player_2, width=self.width, height=self.height)
+        """ Return a deep copy of the current board. The copy starts with an
+        empty undo history.
+        """
+        new_board = Board.__new__(Board)
+        new_board.width = self.width
+        new_board.height = self.height
         new_board.move_count = self.move_count
+        new_board._player_1 = self._player_1
+        new_board._player_2 = self._player_2
         new_board._active_player = self._active_player
         new_board._inactive_player = self._inactive_player
-        new_board._board_state = copy(self._board_state)
+        new_board._tables = self._tables
+        new_board._zobrist_keys = self._zobrist_keys
+        new_board._zobrist_key = self._zobrist_key
+        new_board._board_state = self._board_state[:]
+        new_board._undo_stack = []
+        new_board._moves_cache = list(self._moves_cache)
         return new_board
 
+    def to_bytes(self):
+        """Serialize the game state, without the player objects, to a string
+        of bytes whose size only depends on the board dimensions.
+
+        The encoding is a little-endian header of three unsigned shorts
+        (width, height, move count) followed by the board state: one item
+        per cell (1 if blocked), the initiative, and the locations of player
+        2 and player 1 as cell index + 1 (0 if the player has not moved).
+        Items are single bytes on boards with fewer than 255 cells and
+        unsigned shorts otherwise.
+
+        Returns
+        -------
+        bytes
+            The encoded game state; see from_bytes().
+        """
+        return _pack_state(self.width, self.height, self.move_count, self._board_state)
+
+    @classmethod
+    def from_bytes(cls, data, player_1, player_2):
+        """Build a board from the output of to_bytes().
+
+        Parameters
+        ----------
+        data : bytes
+            A game state encoded by Board.to_bytes() (or BitBoard.to_bytes(),
+            which uses the same encoding).
+
+        player_1 : object
+            The object to register as player 1.
+
+        player_2 : object
+            The object to register as player 2.
+
+        Returns
+        -------
+        isolation.Board
+            A board in the encoded state, with an empty undo history.
+        """
+        width, height, move_count, state = _unpack_state(data)
+        board = cls(player_1, player_2, width=width, height=height)
+        board._restore_state(move_count, state)
+        return board
+
     def forecast_move(self, move):
         """Return a deep copy of the current game with an input move applied to
         advance the game one ply.
@@ -156,22 +410,12 @@ class Board(object):
             The coordinate pair (row, column) of the input player, or None
             if the player has not moved.
         """
-        if player == self._player_1:
-            if self._board_state[-1] == Board.NOT_MOVED:
-                return Board.NOT_MOVED
-            idx = self._board_state[-1]
-        elif player == self._player_2:
-            if self._board_state[-2] == Board.NOT_MOVED:
-                return Board.NOT_MOVED
-            idx = self._board_state[-2]
-        else:
-            raise RuntimeError(
-                "Invalid player in get_player_location: {}".format(player))
-        w = idx // self.height
-        h = idx % self.height
-        return (h, w)
-
-    def get_legal_moves(self, player=None):
+        idx = self._location_index(player)
+        if idx == Board.NOT_MOVED:
+            return Board.NOT_MOVED
+        return self._tables.coords[idx]
+
+    def get_legal_moves(self, player=None, rng=None):
         """Return the list of all legal moves for the specified player.
 
         Parameters
@@ -180,6 +424,11 @@ class Board(object):
             An object registered as a player in the current game. If None,
             return the legal moves for the active player on the board.
 
+        rng : random.Random (optional)
+            A random number generator (or the `random` module) used to
+            shuffle the moves. If None, the moves are returned in a fixed
+            order (increasing cell index).
+
         Returns
         -------
         list<(int, int)>
@@ -188,7 +437,41 @@ class Board(object):
         """
         if player is None:
             player = self.active_player
-        return self.__get_moves(self.get_player_location(player))
+        valid_moves = list(self._legal_moves(player))
+        if rng is not None:
+            rng.shuffle(valid_moves)
+        return valid_moves
+
+    def count_legal_moves(self, player=None):
+        """Return the number of legal moves for the specified player without
+        building the list of moves.
+
+        Parameters
+        ----------
+        player : object (optional)
+            An object registered as a player in the current game. If None,
+            count the legal moves for the active player on the board.
+
+        Returns
+        -------
+        int
+            The number of legal moves available to the player.
+        """
+        if player is None:
+            player = self.active_player
+        cached = self._moves_cache[self._player_slot(player)]
+        if cached is not None:
+            return len(cached)
+        loc = self._location_index(player)
+        if loc == Board.NOT_MOVED:
+            return len(self.get_blank_spaces())
+
+        board_state = self._board_state
+        count = 0
+        for idx in self._tables.moves[loc]:
+            if board_state[idx] == Board.BLANK:
+                count += 1
+        return count
 
     def apply_move(self, move):
         """Move the active player to a specified location.
@@ -201,19 +484,109 @@ class Board(object):
         """
         idx = move[0] + move[1] * self.height
         last_move_idx = int(self.active_player == self._player_2) + 1
-        self._board_state[-last_move_idx] = idx
+        prev_loc = self._board_state[-last_move_idx]  # cell index + 1
+        self._undo_stack.append((idx, prev_loc, self._board_state[-3], self._zobrist_key,
+                                 self._moves_cache))
+        self._moves_cache = [None, None]
+
+        zobrist_keys = self._zobrist_keys
+        player_keys = zobrist_keys.player_2 if last_move_idx == 2 else zobrist_keys.player_1
+        self._zobrist_key ^= zobrist_keys.cells[idx] ^ player_keys[idx] ^ zobrist_keys.side
+        if prev_loc:
+            self._zobrist_key ^= player_keys[prev_loc - 1]
+
+        self._board_state[-last_move_idx] = idx + 1
         self._board_state[idx] = 1
         self._board_state[-3] ^= 1
         self._active_player, self._inactive_player = self._inactive_player, self._active_player
         self.move_count += 1
 
+    def undo_move(self):
+        """Revert the last move applied in place by apply_move(), restoring
+        the previous location of the player that made it and the initiative.
+
+        Search agents can use apply_move() and undo_move() in pairs to walk
+        the game tree on a single board instead of calling forecast_move()
+        for every node.
+        """
+        if not self._undo_stack:
+            raise RuntimeError("There are no moves to undo on this board.")
+        idx, prev_loc, initiative, self._zobrist_key, self._moves_cache = self._undo_stack.pop()
+        self._board_state[-(initiative + 1)] = prev_loc
+        self._board_state[idx] = Board.BLANK
+        self._board_state[-3] = initiative
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        self.move_count -= 1
+
     def is_winner(self, player):
         """ Test whether the specified player has won the game. """
-        return player == self._inactive_player and not self.get_legal_moves(self._active_player)
+        return player == self._inactive_player and not self._legal_moves(self._active_player)
 
     def is_loser(self, player):
         """ Test whether the specified player has lost the game. """
-        return player == self._active_player and not self.get_legal_moves(self._active_player)
+        return player == self._active_player and not self._legal_moves(self._active_player)
+
+    def is_partitioned(self):
+        """Test whether the players can no longer interfere with each other:
+        the blank cells each player can still reach by knight moves are
+        disjoint. From then on, each player can only make the moves of its
+        own longest path, so the game is decided by the lengths of the
+        paths (see longest_path()). A player that has not moved yet can
+        reach any cell, so the board is not partitioned before both moved.
+        """
+        loc_1 = self._location_index(self._player_1)
+        loc_2 = self._location_index(self._player_2)
+        if loc_1 == Board.NOT_MOVED or loc_2 == Board.NOT_MOVED:
+            return False
+        blank = self._blank_mask()
+        masks = self._tables.masks
+        return not reachable_mask(masks, loc_1, blank) & reachable_mask(masks, loc_2, blank)
+
+    def longest_path(self, player=None):
+        """Return a longest sequence of moves the specified player can make
+        on the current board if the cells it visits are not blocked by the
+        opponent, which is certain once the board is partitioned.
+
+        The search is exact and exponential in the number of cells the
+        player can reach, so it is meant for late positions.
+
+        Parameters
+        ----------
+        player : object (optional)
+            An object registered as a player in the current game, which must
+            have moved. If None, return the path of the active player.
+
+        Returns
+        -------
+        list<(int, int)>
+            The coordinate pairs (row, column) of the moves of the path, in
+            order; empty if the player has no legal moves.
+        """
+        if player is None:
+            player = self._active_player
+        loc = self._location_index(player)
+        if loc == Board.NOT_MOVED:
+            raise RuntimeError("The longest path of a player that has not moved is undefined.")
+        masks = self._tables.masks
+        cache = _PATH_LENGTHS.setdefault((self.width, self.height), {})
+        if len(cache) > MAX_PATH_CACHE:
+            cache.clear()
+
+        path = []
+        free = self._blank_mask()
+        length = longest_path_length(masks, loc, free, cache)
+        while length:
+            moves = masks[loc] & free
+            while moves:
+                low = moves & -moves
+                if 1 + longest_path_length(masks, low.bit_length() - 1, free ^ low, cache) == length:
+                    break
+                moves ^= low
+            loc = low.bit_length() - 1
+            free ^= low
+            path.append(self._tables.coords[loc])
+            length -= 1
+        return path
 
     def utility(self, player):
         """Returns the utility of the current game state from the perspective
@@ -237,7 +610,7 @@ class Board(object):
             a value of -inf if the player has lost, and a value of 0
             otherwise.
         """
-        if not self.get_legal_moves(self._active_player):
+        if not self._legal_moves(self._active_player):
 
             if player == self._inactive_player:
                 return float("inf")
@@ -247,20 +620,77 @@ class Board(object):
 
         return 0.
 
+    def _legal_moves(self, player):
+        """Return the legal moves of the specified player from the cache of
+        the current state, generating them on the first request. The list is
+        shared with the cache and must not be modified.
+        """
+        slot = self._player_slot(player)
+        moves = self._moves_cache[slot]
+        if moves is None:
+            moves = self.__get_moves(self._location_index(player))
+            self._moves_cache[slot] = moves
+        return moves
+
+    def _player_slot(self, player):
+        """Return 0 for player 1 and 1 for player 2; raise an error for any
+        object that is not registered as a player in the current game.
+        """
+        if player == self._player_1:
+            return 0
+        elif player == self._player_2:
+            return 1
+        raise RuntimeError(
+            "Invalid player (not registered in the current game): {}".format(player))
+
+    def _location_index(self, player):
+        """Return the cell index of the specified player, or NOT_MOVED if the
+        player has not been placed on the board yet.
+        """
+        loc = self._board_state[-1 - self._player_slot(player)]
+        return loc - 1 if loc else Board.NOT_MOVED
+
+    def _blank_mask(self):
+        """Return the mask of blank cells, with bit `row + column * height` set
+        for blank cell (row, column).
+        """
+        board_state = self._board_state
+        return sum(1 << idx for idx in range(self.width * self.height) if board_state[idx] == Board.BLANK)
+
+    def _restore_state(self, move_count, state):
+        """Replace the game state with a decoded board state array."""
+        self.move_count = move_count
+        self._board_state = state
+        if state[-3]:
+            self._active_player, self._inactive_player = self._player_2, self._player_1
+        self._zobrist_key = self._compute_zobrist_key()
+
+    def _compute_zobrist_key(self):
+        """Compute the Zobrist key of the current state from scratch."""
+        zobrist_keys = self._zobrist_keys
+        key = zobrist_keys.side if self._active_player == self._player_2 else 0
+        blank = set(r + c * self.height for r, c in self.get_blank_spaces())
+        for idx in range(self.width * self.height):
+            if idx not in blank:
+                key ^= zobrist_keys.cells[idx]
+        for player, player_keys in ((self._player_1, zobrist_keys.player_1),
+                                    (self._player_2, zobrist_keys.player_2)):
+            loc = self._location_index(player)
+            if loc != Board.NOT_MOVED:
+                key ^= player_keys[loc]
+        return key
+
     def __get_moves(self, loc):
         """Generate the list of possible moves for an L-shaped motion (like a
-        knight in chess).
+        knight in chess) from the cell index `loc`.
         """
         if loc == Board.NOT_MOVED:
             return self.get_blank_spaces()
 
-        r, c = loc
-        directions = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                      (1, -2), (1, 2), (2, -1), (2, 1)]
-        valid_moves = [(r + dr, c + dc) for dr, dc in directions
-                       if self.move_is_legal((r + dr, c + dc))]
-        random.shuffle(valid_moves)
-        return valid_moves
+        board_state = self._board_state
+        coords = self._tables.coords
+        return [coords[idx] for idx in self._tables.moves[loc]
+                if board_state[idx] == Board.BLANK]
 
     def print_board(self):
         """DEPRECATED - use Board.to_string()"""
@@ -271,8 +701,8 @@ class Board(object):
         the location of each player and indicating which cells have been
         blocked, and which remain open.
         """
-        p1_loc = self._board_state[-1]
-        p2_loc = self._board_state[-2]
+        p1_loc = self._board_state[-1] - 1
+        p2_loc = self._board_state[-2] - 1
 
         col_margin = len(str(self.height - 1)) + 1
         prefix = "{:<" + "{}".format(col_margin) + "}"
@@ -0,0 +1,537 @@
+"""This file contains parallel versions of the alpha-beta agent of game_agent.py,
+and of its Monte Carlo tree search agent, which search the same position on
+several processes at once: `LazySMPPlayer` runs whole searches in every
+process, `RootSplitPlayer` splits the root moves of each search across a pool
+of processes, and `RootParallelMCTSPlayer` grows an independent tree in every
+process.
+
+Worker processes are started once per player and kept for its lifetime; call
+`close()` on the player (or let it be garbage collected) to stop them.
+Deadlines are exchanged as absolute `time.perf_counter()` values, whose clock
+is shared by all processes on the supported platforms.
+"""
+import math
+import multiprocessing
+import random
+import time
+import weakref
+
+import game_agent
+
+from game_agent import EXACT, RESOLVED_DEPTH, AlphaBetaPlayer, MCTSPlayer, custom_score
+from shared_table import SharedTranspositionTable
+
+
+class LazySMPPlayer(AlphaBetaPlayer):
+    """Game-playing agent that runs the iterative deepening alpha-beta search
+    of `AlphaBetaPlayer` on the same position in this process and in
+    `workers` worker processes, in the lazy SMP style.
+
+    All searches share one `SharedTranspositionTable`, so each benefits from
+    the results of the others. The workers diverge from the main search by
+    shuffling moves of equal rank before ordering them, and every other
+    worker starts at depth two. When the main search stops (at the deadline
+    or with an exact result), the workers stop as well and the best move of
+    the deepest completed pass over all processes is played.
+
+    Parameters
+    ----------
+    workers : int (optional)
+        Number of worker processes; one less than the number of CPUs if None
+        (so none on a single CPU, where the player searches like its parent).
+
+    The other parameters are those of `AlphaBetaPlayer`; `table_size` sizes
+    the shared table. The time manager and pondering are not used.
+    """
+    def __init__(self, search_depth=11, score_fn=custom_score, timeout=10., table_size=1 << 16,
+                 workers=None, **kwargs):
+        kwargs.update(manage_time=False, ponder=False)
+        AlphaBetaPlayer.__init__(self, search_depth=search_depth, score_fn=score_fn, timeout=timeout,
+                                 table=SharedTranspositionTable(table_size), **kwargs)
+        self.workers = workers if workers is not None else multiprocessing.cpu_count() - 1
+        self._worker_kwargs = dict(kwargs, score_fn=score_fn, timeout=timeout)
+        self._search_id = 0
+        self._stop = multiprocessing.Event()
+        self._connections = []
+        self._processes = []
+        self._finalizer = weakref.finalize(self, _shutdown, self._connections, self._processes,
+                                           self.transporition_table)
+
+    def get_move(self, game, time_left):
+        """Search for the best move in this process and in the worker
+        processes, and return the best move of the deepest completed pass.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            An instance of `isolation.Board` encoding the current state of the
+            game (e.g., player locations and blocked cells).
+
+        time_left : callable
+            A function that returns the number of milliseconds left in the
+            current turn. Returning with any less than 0 ms remaining forfeits
+            the game.
+
+        Returns
+        -------
+        (int, int)
+            Board coordinates corresponding to a legal move; may return
+            (-1, -1) if there are no available legal moves.
+        """
+        self.time_left = time_left
+        self.start_search(game)
+        self.start_clock()
+
+        if not game.get_legal_moves():
+            return (-1, -1)
+        if self.tablebase is not None:
+            tablebase_move = self.tablebase.best_move(game)
+            if tablebase_move is not None:
+                return tablebase_move
+        proven_move = self.prove_win(game)
+        if proven_move is not None:
+            return proven_move
+
+        self._start_workers()
+        self._search_id += 1
+        self._stop.clear()
+        _send_search(self, self._connections, self._search_id, game)
+
+        results = [deepen(self, game, 1)]
+
+        self._stop.set()
+        results += [result for result, in _collect_results(self, self._connections, self._search_id)]
+        results = [result for result in results if result is not None]
+        if not results:
+            return self._partial_move if self._partial_move is not None else (-1, -1)
+        # the first result of the highest (exact, depth) rank, preferring the main search
+        depth, move, exact = max(results, key=lambda result: (result[2], result[0]))
+        self.last_depth = depth
+        return move
+
+    def close(self):
+        """ stop the worker processes and free the shared transposition table """
+        self._finalizer()
+
+    def _start_workers(self):
+        """ start the worker processes, unless they are running """
+        if not self._processes:
+            _start_processes(self._connections, self._processes, _smp_worker,
+                             [(worker_id, self.transporition_table, self._stop, self._worker_kwargs)
+                              for worker_id in range(1, self.workers + 1)])
+
+
+class _SMPWorkerPlayer(AlphaBetaPlayer):
+    """Searcher of a lazy SMP worker process. It shares the transposition
+    table, and the table generation, of the main player, shuffles moves of
+    equal rank with its own random generator and stops when the main search
+    does.
+    """
+    def __init__(self, worker_id, table, stop, **kwargs):
+        AlphaBetaPlayer.__init__(self, table=table, **kwargs)
+        self.worker_id = worker_id
+        self._stop = stop
+        self._rng = random.Random(worker_id)
+
+    def start_search(self, game):
+        """ reset the per-move ordering state only: the main player starts new games and searches """
+        self._pv = []
+        self._killers = []
+        self._root_move_count = game.move_count
+        for move in self._history:
+            self._history[move] //= 2
+
+    def check_clock(self):
+        if self._stop.is_set():
+            raise game_agent.SearchTimeout()
+        AlphaBetaPlayer.check_clock(self)
+
+    def order_moves(self, game, legal_moves, ply, key, tt_move=None):
+        self._rng.shuffle(legal_moves)
+        return AlphaBetaPlayer.order_moves(self, game, legal_moves, ply, key, tt_move)
+
+    def search(self, game, deadline):
+        """ search the position until the deadline (a time.perf_counter() value) or until stopped """
+        self.start_search(game)
+        self._deadline = deadline
+        self._next_check = self._nodes + 1
+        self._last_check = (self._nodes, time.perf_counter())
+        return deepen(self, game, 1 + self.worker_id % 2)
+
+
+class RootSplitPlayer(AlphaBetaPlayer):
+    """Game-playing agent that runs the iterative deepening alpha-beta search
+    of `AlphaBetaPlayer`, splitting the root moves of each pass from
+    `split_depth` on across a pool of `workers` worker processes.
+
+    The first root move (the best move of the previous pass) is searched in
+    this process to get a bound for the others, which are then sent to the
+    pool as the encoded root position (see `Board.to_bytes()`) and a move.
+    Each worker searches the subtree of its move to the depth of the pass
+    with the best root score found so far as alpha, and raises that shared
+    bound when it finds a better move, so that the moves still queued are
+    searched with a narrower window. Shallower passes, whose subtrees are too
+    small to pay for the round trip to the pool, are searched here.
+
+    The pool is started by new_game() (or by the first split pass) and kept
+    for the lifetime of the player. Each worker keeps its own transposition
+    table across the tasks of a game, and clears it at the first task of
+    the next one, as the player may have changed seats.
+
+    Parameters
+    ----------
+    workers : int (optional)
+        Number of worker processes; the number of CPUs if None, as this
+        process mostly waits for the workers.
+
+    split_depth : int (optional)
+        Depth of the first pass whose root moves are split across the pool.
+
+    The other parameters are those of `AlphaBetaPlayer`; the search mode is
+    always "alphabeta" and pondering is not used.
+    """
+    def __init__(self, search_depth=11, score_fn=custom_score, timeout=10., table_size=1 << 16,
+                 workers=None, split_depth=4, **kwargs):
+        kwargs.update(search_mode="alphabeta", ponder=False)
+        AlphaBetaPlayer.__init__(self, search_depth=search_depth, score_fn=score_fn, timeout=timeout,
+                                 table_size=table_size, **kwargs)
+        self.workers = workers if workers is not None else multiprocessing.cpu_count()
+        self.split_depth = split_depth
+        self._worker_kwargs = dict(score_fn=score_fn, timeout=timeout, table_size=table_size,
+                                   order_by_mobility=self.order_by_mobility, endgame_cells=self.endgame_cells)
+        """ id of the current game, sent with each task so that the workers start a new game with it """
+        self._game_id = 0
+        """ id of the current split pass and the best root score found in it, shared with the workers """
+        self._split_id = 0
+        self._bound = multiprocessing.Array("d", [0., -math.inf])
+        self._pool = None
+        self._finalizer = None
+
+    def new_game(self):
+        """ reset the per-game search state, also in the workers, and start the worker pool, unless it is
+            running
+        """
+        AlphaBetaPlayer.new_game(self)
+        self._game_id += 1
+        self._start_pool()
+
+    def close(self):
+        """ stop the worker processes """
+        if self._finalizer is not None:
+            self._finalizer()
+        self._pool = self._finalizer = None
+
+    def search_pass(self, game, depth, score=None):
+        """ run one iterative deepening pass, splitting the root moves across the worker pool from
+            split_depth on; returns a tuple (<score>, <move>)
+        """
+        legal_moves = game.get_legal_moves()
+        if depth < self.split_depth or len(legal_moves) < 2 or not self.workers:
+            return AlphaBetaPlayer.search_pass(self, game, depth, score)
+        self._start_pool()
+
+        key = self.get_board_state_key(game)
+        entry = self.transporition_table.peek(key)
+        moves = self.order_moves(game, legal_moves, 0, key, entry[3] if entry is not None else None)
+
+        # the first move is searched here, with the full window
+        game.apply_move(moves[0])
+        try:
+            best_score, _ = self._alphabeta(game, depth - 1)
+        finally:
+            game.undo_move()
+        best_move = self._partial_move = moves[0]
+
+        self._split_id += 1
+        with self._bound.get_lock():
+            self._bound[:] = [self._split_id, best_score]
+        worker_deadline = _worker_deadline(self)
+        data = game.to_bytes()
+        pending = [self._pool.apply_async(_split_search, (self._game_id, self._split_id, type(game), data, m,
+                                                          depth, worker_deadline))
+                   for m in moves[1:]]
+        while pending:
+            for result in [result for result in pending if result.ready()]:
+                pending.remove(result)
+                move, score, alpha, horizon_nodes = result.get()
+                if score is None:
+                    raise game_agent.SearchTimeout()
+                self._horizon_nodes += horizon_nodes
+                # a score at or below the alpha of its search only bounds the move from above, and the move
+                # that raised alpha is better; scores above it are exact, so the best move so far is always
+                # a valid partial result
+                if score > alpha and score > best_score:
+                    best_score, best_move = score, move
+                    self._partial_move = move
+            if pending:
+                pending[0].wait(0.001)
+                if time.perf_counter() >= self._deadline:
+                    raise game_agent.SearchTimeout()
+
+        self.transporition_table.store(key, RESOLVED_DEPTH if not self._horizon_nodes else depth,
+                                       best_score, EXACT, best_move)
+        return best_score, best_move
+
+    def _start_pool(self):
+        """ start the worker pool, unless it is running """
+        if self._pool is not None or not self.workers:
+            return
+        self._pool = multiprocessing.Pool(self.workers, initializer=_init_split_worker,
+                                          initargs=(self._bound, self._worker_kwargs))
+        self._finalizer = weakref.finalize(self, self._pool.terminate)
+
+
+class RootParallelMCTSPlayer(MCTSPlayer):
+    """Game-playing agent that runs the Monte Carlo tree search of
+    `MCTSPlayer` on the same position in this process and in `workers`
+    worker processes, each growing an independent tree (root
+    parallelization). The visit counts of the root moves are summed over
+    all trees, and the most visited move is played.
+
+    The workers receive the encoded position (see `Board.to_bytes()`) and
+    keep their trees between moves like the main player does.
+
+    Parameters
+    ----------
+    workers : int (optional)
+        Number of worker processes; one less than the number of CPUs if None
+        (so none on a single CPU, where the player searches like its parent).
+
+    The other parameters are those of `MCTSPlayer`. `rollouts` counts the
+    rollouts of all processes.
+    """
+    def __init__(self, timeout=10., workers=None, **kwargs):
+        MCTSPlayer.__init__(self, timeout=timeout, **kwargs)
+        self.workers = workers if workers is not None else multiprocessing.cpu_count() - 1
+        self._worker_kwargs = dict(kwargs, timeout=timeout)
+        """ visit counts of the root moves of the last search, summed over all trees and keyed by (row, col) """
+        self.merged_visits = {}
+        self._search_id = 0
+        self._connections = []
+        self._processes = []
+        self._finalizer = weakref.finalize(self, _shutdown, self._connections, self._processes)
+
+    def get_move(self, game, time_left):
+        """Search for the best move in this process and in the worker
+        processes, and return the move with the most visits over all trees.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            An instance of `isolation.Board` encoding the current state of the
+            game (e.g., player locations and blocked cells).
+
+        time_left : callable
+            A function that returns the number of milliseconds left in the
+            current turn. Returning with any less than 0 ms remaining forfeits
+            the game.
+
+        Returns
+        -------
+        (int, int)
+            Board coordinates corresponding to a legal move; may return
+            (-1, -1) if there are no available legal moves.
+        """
+        self.time_left = time_left
+        self.start_clock()
+
+        if not game.get_legal_moves():
+            return (-1, -1)
+
+        self._start_workers()
+        self._search_id += 1
+        _send_search(self, self._connections, self._search_id, game)
+
+        move = self.search(game)
+        visits = self.visit_counts()
+        for worker_visits, rollouts in _collect_results(self, self._connections, self._search_id):
+            self.rollouts += rollouts
+            for worker_move, count in worker_visits.items():
+                visits[worker_move] = visits.get(worker_move, 0) + count
+
+        self.merged_visits = visits
+        if not visits:
+            return move
+        return max(visits, key=visits.get)
+
+    def close(self):
+        """ stop the worker processes """
+        self._finalizer()
+
+    def _start_workers(self):
+        """ start the worker processes, unless they are running """
+        if not self._processes:
+            _start_processes(self._connections, self._processes, _mcts_worker,
+                             [(self._worker_kwargs,)] * self.workers)
+
+
+def deepen(player, game, depth):
+    """ run the iterative deepening passes of an AlphaBetaPlayer from the given depth until the search
+        times out or is exact; returns (<depth>, <move>, <exact>) for the last completed pass, or None
+    """
+    result = None
+    score = None
+    try:
+        while True:
+            player._horizon_nodes = 0
+            player._partial_move = None
+            score, move = player.search_pass(game, depth, score)
+            exact = player.search_is_exact(score)
+            result = (depth, move, exact)
+            if exact:
+                break
+            player._pv = player.principal_variation(game, depth)
+            depth += 1
+    # looked up at run time, like the search methods do, so that it matches after game_agent is reloaded
+    except game_agent.SearchTimeout:
+        pass
+    return result
+
+
+def _worker_deadline(player):
+    """ return the deadline of the worker searches for the current search of the player: the workers stop
+        a little earlier, so that their results arrive in time
+    """
+    return player._deadline - player.TIMER_THRESHOLD / 4000.
+
+
+def _start_processes(connections, processes, target, worker_args):
+    """ start a worker process running target(<connection>, *args) for each tuple of args, adding the
+        other end of its pipe to connections and the process to processes
+    """
+    for args in worker_args:
+        connection, worker_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=target, daemon=True, args=(worker_connection,) + tuple(args))
+        process.start()
+        connections.append(connection)
+        processes.append(process)
+
+
+def _send_search(player, connections, search_id, game):
+    """ send the encoded position to search to the worker processes, with the search id and deadline """
+    message = (search_id, type(game), game.to_bytes(), _worker_deadline(player))
+    for connection in connections:
+        connection.send(message)
+
+
+def _collect_results(player, connections, search_id):
+    """ return the results (the message without the search id) sent by the worker processes for the given
+        search, waiting for each worker while the player has time, then draining stale results
+    """
+    results = []
+    for connection in connections:
+        while not connection.poll(0.001) and player.time_left() > player.TIMER_THRESHOLD / 2:
+            pass
+        while connection.poll():
+            message = connection.recv()
+            if message[0] == search_id:
+                results.append(message[1:])
+    return results
+
+
+def _decode_board(board_class, data, player):
+    """ decode a position sent to a worker process, with the player in the seat of the active player """
+    game = board_class.from_bytes(data, player, "opponent")
+    if game.active_player != player:
+        game = board_class.from_bytes(data, "opponent", player)
+    return game
+
+
+def _smp_worker(connection, worker_id, table, stop, kwargs):
+    """ main loop of a lazy SMP worker process: search each position received until told to exit """
+    player = _SMPWorkerPlayer(worker_id, table, stop, **kwargs)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        search_id, board_class, data, deadline = message
+        game = _decode_board(board_class, data, player)
+        connection.send((search_id, player.search(game, deadline)))
+    table.close()
+
+
+# searcher of a root split worker process and the bound shared with the main player
+_split_player = None
+_split_bound = None
+
+
+def _init_split_worker(bound, kwargs):
+    """ create the searcher of a root split worker process """
+    global _split_player, _split_bound
+    _split_player = AlphaBetaPlayer(manage_time=False, **kwargs)
+    _split_player._split_game = None
+    _split_player._split_root = None
+    _split_bound = bound
+
+
+def _split_search(game_id, split_id, board_class, data, move, depth, deadline):
+    """ search the given root move of the encoded position to the depth of the pass, with the best root
+        score of the split pass as alpha; returns (<move>, <score>, <alpha>, <horizon nodes>), with a None
+        score if the search timed out
+    """
+    player = _split_player
+    game = _decode_board(board_class, data, player)
+    if game_id != player._split_game:
+        # the table holds scores from the seat of the last game, which the main player may have left
+        player._split_game = game_id
+        player.new_game()
+    if data != player._split_root:
+        # a new root position: the moves searched for it share a table generation
+        player._split_root = data
+        player.transporition_table.new_search()
+        player._history = {}
+    player._pv = []
+    player._killers = []
+    player._root_move_count = game.move_count
+    player._horizon_nodes = 0
+    player._deadline = deadline
+    player._next_check = player._nodes + 1
+    player._last_check = (player._nodes, time.perf_counter())
+
+    with _split_bound.get_lock():
+        alpha = _split_bound[1] if _split_bound[0] == split_id else -math.inf
+    game.apply_move(move)
+    try:
+        score, _ = player._alphabeta(game, depth - 1, alpha, math.inf)
+    except game_agent.SearchTimeout:
+        return move, None, alpha, 0
+
+    # raise the shared bound for the moves still queued; scores at or below alpha are only upper bounds
+    with _split_bound.get_lock():
+        if _split_bound[0] == split_id and score > _split_bound[1]:
+            _split_bound[1] = score
+    return move, score, alpha, player._horizon_nodes
+
+
+def _mcts_worker(connection, kwargs):
+    """ main loop of a root parallel MCTS worker process: grow a tree for each position received until
+        told to exit, and send back the visit counts of the root moves
+    """
+    # forked workers inherit the random state of the main process, which would repeat its rollouts
+    random.seed()
+    player = MCTSPlayer(**kwargs)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        search_id, board_class, data, deadline = message
+        game = _decode_board(board_class, data, player)
+        player._deadline = deadline
+        player.search(game)
+        connection.send((search_id, player.visit_counts(), player.rollouts))
+
+
+def _shutdown(connections, processes, table=None):
+    """ stop the worker processes of a player and free its shared table, if any """
+    for connection in connections:
+        try:
+            connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+    for process in processes:
+        process.join(1.)
+        if process.is_alive():
+            process.terminate()
+    del connections[:], processes[:]
+    if table is not None:
+        table.close()
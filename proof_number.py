@@ -0,0 +1,196 @@
+"""This file contains `ProofNumberSearch`, a depth-first proof-number (df-pn)
+search that proves or disproves a forced win for the player to move.
+
+Unlike alpha-beta, the search needs no evaluation function and no depth
+limit: it only distinguishes won, lost and unknown positions, and grows the
+tree where the fewest positions remain to be solved. This makes it a good
+fit for late Isolation positions, where it can prove the result of the game
+long before a depth-limited search sees the end of it.
+
+The search runs on a compact copy of the position: an integer mask of the
+blocked cells and the cell index of each player, like `MCTSPlayer`.
+"""
+import math
+import time
+
+from isolation.isolation import get_move_tables, mask_cells, position_masks
+
+# proof and disproof numbers of solved positions
+INFINITY = 1 << 40
+
+# number of nodes searched between two clock checks
+CHECK_INTERVAL = 1024
+
+
+class BudgetExhausted(Exception):
+    """Raised inside the search when it runs out of nodes or time."""
+    pass
+
+
+class ProofNumberSearch:
+    """Depth-first proof-number search for Isolation positions.
+
+    Each position of the search holds a proof number (the number of leaves
+    that must be won to prove a win for the player to move) and a disproof
+    number (the same to prove a loss), stored negamax style: a position is
+    won once one of its children has a disproof number of 0, and lost once
+    all of them have a proof number of 0. Unsolved children are estimated
+    from their number of legal moves. The numbers of searched positions are
+    kept in a table between calls, so a later call for the same game starts
+    from the work of the earlier ones.
+
+    Each position in the table also records the number of nodes spent on
+    it. Between calls, the table is trimmed to `max_entries` positions by
+    evicting unsolved positions before solved ones, the least worked first,
+    as they are the cheapest to search again. A call stores at most one
+    position per node, so the table never holds more than `max_entries`
+    plus the node budget of a call. Trimming never happens during a call,
+    as evicting the numbers of the positions being searched would make the
+    search go over the same nodes again and again.
+
+    Parameters
+    ----------
+    max_entries : int (optional)
+        Number of positions the table is trimmed to at the start of a call.
+    """
+    def __init__(self, max_entries=1 << 18):
+        self.max_entries = max_entries
+        """ (<proof number>, <disproof number>, <nodes searched>) per position (<blocked mask>, <location to move>,
+            <other location>)
+        """
+        self._table = {}
+        """ number of nodes searched by the last call to prove() """
+        self.nodes = 0
+        self._max_nodes = 0
+        self._deadline = math.inf
+        self._next_check = 0
+        """ (<width>, <height>) of the board being searched, its move tables and mask of all cells """
+        self._board_size = None
+        self._tables = None
+        self._full_mask = 0
+
+    def __len__(self):
+        return len(self._table)
+
+    def clear(self):
+        """ remove all positions from the table, e.g. at the start of a new game """
+        self._table = {}
+
+    def prove(self, game, max_nodes=100000, deadline=math.inf):
+        """ search the position for a forced win of the player to move, expanding at most max_nodes
+            positions and stopping at the given deadline on the time.perf_counter() clock; returns a tuple
+            (<result>, <move>) where result is True for a proven win, False for a proven loss and None if
+            the search ran out of nodes or time, and move is a winning move (a proven win only) or (-1, -1)
+        """
+        root = self._game_state(game)
+        self._trim()
+        self.nodes = 0
+        self._max_nodes = max_nodes
+        self._deadline = deadline
+        self._next_check = CHECK_INTERVAL
+        try:
+            self._search(root, INFINITY, INFINITY)
+        except BudgetExhausted:
+            pass
+
+        proof, disproof, _ = self._table.get(root, (1, 1, 0))
+        if proof == 0:
+            return True, self._tables.coords[self._winning_move(root)]
+        if disproof == 0:
+            return False, (-1, -1)
+        return None, (-1, -1)
+
+    def _search(self, state, proof_threshold, disproof_threshold):
+        """ expand the position until its proof number reaches proof_threshold or its disproof number
+            reaches disproof_threshold, then store both in the table
+        """
+        self.nodes += 1
+        if self.nodes >= self._next_check:
+            if self.nodes > self._max_nodes or time.perf_counter() >= self._deadline:
+                raise BudgetExhausted()
+            self._next_check = self.nodes + CHECK_INTERVAL
+
+        children = self._children(state)
+        if not children:
+            # the player to move is stuck and loses
+            self._table[state] = (INFINITY, 0, 1)
+            return
+
+        estimates = [self._estimate(child) for child in children]
+        start = self.nodes
+        while True:
+            # the position is won if a child is lost for the opponent (min of the disproof numbers),
+            # and lost if every child is won for the opponent (sum of the proof numbers)
+            table = self._table
+            disproof = 0
+            best = best_proof = None
+            best_disproof = second_disproof = INFINITY
+            for child, estimate in zip(children, estimates):
+                child_proof, child_disproof, _ = table.get(child, estimate)
+                disproof += child_proof
+                if child_disproof < best_disproof:
+                    second_disproof = best_disproof
+                    best, best_disproof, best_proof = child, child_disproof, child_proof
+                elif child_disproof < second_disproof:
+                    second_disproof = child_disproof
+            proof = best_disproof
+            disproof = min(disproof, INFINITY)
+            if proof >= proof_threshold or disproof >= disproof_threshold:
+                break
+            self._search(best, disproof_threshold - disproof + best_proof,
+                         min(proof_threshold, second_disproof + 1))
+        work = table.get(state, (0, 0, 0))[2]
+        table[state] = (proof, disproof, work + 1 + self.nodes - start)
+
+    def _children(self, state):
+        """ return the positions after each legal move of the player to move """
+        occupied, loc, other_loc = state
+        if loc is None:
+            moves = self._full_mask & ~occupied
+        else:
+            moves = self._tables.masks[loc] & ~occupied
+        return [(occupied | 1 << move, other_loc, move) for move in mask_cells(moves)]
+
+    def _estimate(self, state):
+        """ return the initial (<proof number>, <disproof number>, <nodes searched>) of an unsearched
+            position: solved if the player to move is stuck, otherwise one leaf to prove a win and one per
+            legal move to prove a loss
+        """
+        occupied, loc, _ = state
+        if loc is None:
+            moves = self._full_mask & ~occupied
+        else:
+            moves = self._tables.masks[loc] & ~occupied
+        count = bin(moves).count("1")
+        return (1, count, 0) if count else (INFINITY, 0, 0)
+
+    def _trim(self):
+        """ evict positions until the table holds at most max_entries: unsolved positions before solved ones,
+            and the least worked first
+        """
+        table = self._table
+        excess = len(table) - self.max_entries
+        if excess <= 0:
+            return
+        candidates = sorted((entry[0] == 0 or entry[1] == 0, entry[2], key) for key, entry in table.items())
+        for _, _, key in candidates[:excess]:
+            del table[key]
+
+    def _winning_move(self, state):
+        """ return the cell index of a move from a won position to a position lost for the opponent """
+        for child in self._children(state):
+            if self._table.get(child, self._estimate(child))[1] == 0:
+                return child[2]
+
+    def _game_state(self, game):
+        """ return the position of the game as a tuple (<blocked mask>, <location to move>, <other location>)
+            of cell indices, setting up the move tables for its board size
+        """
+        if self._board_size != (game.width, game.height):
+            # boards with the same number of cells in another shape have other move tables
+            self._board_size = (game.width, game.height)
+            self._tables = get_move_tables(game.width, game.height)
+            self._full_mask = (1 << (game.width * game.height)) - 1
+            self._table = {}
+        blank, loc, other_loc = position_masks(game)
+        return self._full_mask & ~blank, loc, other_loc
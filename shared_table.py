@@ -0,0 +1,200 @@
+"""This file contains `SharedTranspositionTable`, a transposition table kept in
+shared memory so that the processes of a parallel search can read and write
+the same entries.
+
+It exposes the same interface as `game_agent.TranspositionTable` and follows
+the same replacement policy, but stores each entry as a packed struct in a
+`multiprocessing.shared_memory` block (or in a memory-mapped file) instead of
+Python lists. Pickling a table (e.g. to pass it to a worker process) only
+sends the name of the block or the path of the file, which the receiving
+process attaches to.
+"""
+import mmap
+import os
+import struct
+
+from multiprocessing import resource_tracker, shared_memory
+
+from game_agent import EXACT
+
+# header: generation of the current search, shared by all processes
+HEADER = struct.Struct("<Q")
+
+# entry: check word, then the payload: score, depth, bound + 1 (0 for an empty
+# slot), generation of the search that stored it (modulo 256), move row and
+# column (-1 if none); the check word is the key xor the two payload words, so
+# that an entry torn by concurrent writes no longer matches its key
+ENTRY = struct.Struct("<QdiBBbb")
+PAYLOAD = struct.Struct("<diBBbb")
+PAYLOAD_WORDS = struct.Struct("<QQ")
+ENTRY_WORDS = struct.Struct("<QQQ")
+
+class SharedTranspositionTable:
+    """Fixed-size transposition table in a shared memory block or a memory
+    mapped file, usable from several processes at once.
+
+    Writes are not locked: processes may overwrite each other's entries, and
+    a reader may see an entry while another process is writing it. The check
+    word of each entry turns such a torn entry into a miss. Scores are from
+    the perspective of the player that stored them, so a table should only
+    be shared by searches for the same player and seat.
+
+    Parameters
+    ----------
+    size : int (optional)
+        Number of slots, rounded up to a power of two. The memory used by the
+        table is `size * ENTRY.size` bytes plus a small header.
+
+    name : str (optional)
+        Name of an existing block to attach to instead of creating a new one.
+
+    path : str (optional)
+        Path of a file to map instead of a shared memory block. The file is
+        created (or resized, which clears it) as needed, and outlives the
+        table, so that independent processes can open the same table.
+    """
+    def __init__(self, size=1 << 16, name=None, path=None):
+        self.size = 1 << max(0, size - 1).bit_length()
+        self._mask = self.size - 1
+        nbytes = HEADER.size + self.size * ENTRY.size
+        self.path = path
+        self._shm = self._mmap = None
+        fresh = False
+        if path is not None:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT)
+            try:
+                if os.fstat(fd).st_size != nbytes:
+                    os.ftruncate(fd, nbytes)
+                    fresh = True
+                self._mmap = mmap.mmap(fd, nbytes)
+            finally:
+                os.close(fd)
+            self._buf = memoryview(self._mmap)
+            self._owner = None
+        elif name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self._buf = self._shm.buf
+            # a forked process inherits the table, but only its creator frees the block
+            self._owner = os.getpid()
+            fresh = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._buf = self._shm.buf
+            self._owner = None
+            # only the creating process frees the block; the resource tracker would
+            # otherwise free it as soon as any attached process exits
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        self.probes = 0
+        self.hits = 0
+        self.cutoffs = 0
+        if fresh:
+            self.clear()
+
+    def __getstate__(self):
+        return {"size": self.size, "name": self.name, "path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["size"], name=state["name"], path=state["path"])
+
+    @property
+    def name(self):
+        """ name of the shared memory block (None for a table mapped from a file) """
+        return self._shm.name if self._shm is not None else None
+
+    @property
+    def generation(self):
+        """ generation of the current search, shared by all processes """
+        return HEADER.unpack_from(self._buf, 0)[0]
+
+    def _read(self, key):
+        """ return the unpacked payload of the slot of the position key if it holds a whole entry for it,
+            or None
+        """
+        offset = HEADER.size + (key & self._mask) * ENTRY.size
+        check, low, high = ENTRY_WORDS.unpack_from(self._buf, offset)
+        if check ^ low ^ high != key:
+            return None
+        payload = PAYLOAD.unpack_from(self._buf, offset + 8)
+        return payload if payload[2] else None
+
+    def lookup(self, key):
+        """ return the entry (depth, score, bound, move) stored for the position key, or None """
+        self.probes += 1
+        slot = self._read(key)
+        if slot is None:
+            return None
+        self.hits += 1
+        return _entry(slot)
+
+    def peek(self, key):
+        """ return the entry stored for the position key, or None, without counting the lookup """
+        slot = self._read(key)
+        return None if slot is None else _entry(slot)
+
+    def record_cutoff(self):
+        """ count an entry returned by lookup() that was deep and tight enough to replace a search """
+        self.cutoffs += 1
+
+    def store(self, key, depth, score, bound, move):
+        """ store a search result, unless the slot holds a more valuable result of the current search,
+            whether for the same position or another one
+        """
+        offset = HEADER.size + (key & self._mask) * ENTRY.size
+        _, old_depth, old_bound, age, _, _ = PAYLOAD.unpack_from(self._buf, offset + 8)
+        generation = self.generation & 0xFF
+        if old_bound and age == generation and (
+                old_depth > depth or (old_depth == depth and old_bound - 1 == EXACT and bound != EXACT)):
+            return
+        row, col = move if move is not None else (-1, -1)
+        payload = PAYLOAD.pack(score, depth, bound + 1, generation, row, col)
+        low, high = PAYLOAD_WORDS.unpack(payload)
+        ENTRY_WORDS.pack_into(self._buf, offset, key ^ low ^ high, low, high)
+
+    def new_search(self):
+        """ start a new search; entries stored by earlier searches stay available but are replaced
+            first when slots collide
+        """
+        HEADER.pack_into(self._buf, 0, self.generation + 1)
+
+    def clear(self):
+        """ remove all entries; the lookup statistics of this process are kept """
+        self._buf[:] = bytes(len(self._buf))
+
+    @property
+    def used(self):
+        """ number of slots holding an entry (counted by scanning the table) """
+        entries = self._buf[HEADER.size:HEADER.size + self.size * ENTRY.size]
+        return sum(1 for slot in ENTRY.iter_unpack(entries) if slot[3])
+
+    @property
+    def occupancy(self):
+        """ fraction of the slots holding an entry """
+        return self.used / float(self.size)
+
+    @property
+    def hit_rate(self):
+        """ fraction of the lookups of this process that found an entry for the position """
+        return self.hits / float(self.probes) if self.probes else 0.
+
+    @property
+    def cutoff_rate(self):
+        """ fraction of the lookups of this process whose entry replaced a search """
+        return self.cutoffs / float(self.probes) if self.probes else 0.
+
+    def close(self):
+        """ detach this process from the shared memory block or file, and free the block if this table
+            created it
+        """
+        self._buf.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            return
+        self._shm.close()
+        if self._owner == os.getpid():
+            self._shm.unlink()
+
+
+def _entry(payload):
+    """ convert an unpacked slot payload into an entry (depth, score, bound, move) """
+    score, depth, bound, _, row, col = payload
+    return (depth, score, bound - 1, (row, col))
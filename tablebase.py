@@ -0,0 +1,339 @@
+"""This file contains `Tablebase`, a file of precomputed game-theoretic values
+of Isolation endgames, and `generate()`, which builds one by retrograde
+analysis.
+
+A position only depends on the locations of the players and on the blank
+cells they can still reach: every other cell might as well be blocked. The
+tablebase holds every such position of a board size with at most
+`max_blank` reachable blank cells, once per symmetry class of the board. On
+small boards the threshold can cover most of a game; on the 7x7 board it
+covers late positions.
+
+Each position is stored under an exact key, the canonical encoding of its
+reachable blank cells and locations (see `canonical_key()`), in an open
+addressing hash table in the file. The file is memory-mapped, so a probe
+costs a few slot reads and opening a table costs nothing, whatever its size.
+Pickling a tablebase (e.g. to pass it to a worker process) only sends its
+path.
+"""
+import mmap
+import os
+import struct
+
+from isolation.isolation import get_move_tables, mask_cells, position_masks, reachable_mask
+
+# file header: magic, format version, width, height, max_blank, number of slots and of positions
+HEADER = struct.Struct("<6sHHHHQQ")
+MAGIC = b"ISOLTB"
+VERSION = 1
+
+# slot: exact key of the position, and its value (0 for an empty slot)
+SLOT = struct.Struct("<QB")
+
+# multiplier of the Fibonacci hash of the keys
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+# cache of the cell permutations of the symmetries of each (width, height) board size
+_SYMMETRIES = {}
+
+
+def get_symmetries(width, height):
+    """Return the symmetries of a board of the given size as permutations
+    of the cell indices (`row + column * height`), identity first: the
+    reflections and the half turn, plus the quarter turns and the diagonal
+    reflections on square boards.
+    """
+    key = (width, height)
+    if key not in _SYMMETRIES:
+        transforms = [lambda r, c: (r, c), lambda r, c: (height - 1 - r, c),
+                      lambda r, c: (r, width - 1 - c), lambda r, c: (height - 1 - r, width - 1 - c)]
+        if width == height:
+            transforms += [lambda r, c: (c, r), lambda r, c: (width - 1 - c, r),
+                           lambda r, c: (c, height - 1 - r), lambda r, c: (width - 1 - c, height - 1 - r)]
+        permutations = []
+        for transform in transforms:
+            permutation = []
+            for idx in range(width * height):
+                r, c = transform(idx % height, idx // height)
+                permutation.append(r + c * height)
+            permutations.append(permutation)
+        _SYMMETRIES[key] = permutations
+    return _SYMMETRIES[key]
+
+
+def canonical_key(width, height, blank, loc, other_loc):
+    """Return the exact key of a position, given as a mask of the blank
+    cells and the cell indices of the player to move and of its opponent.
+
+    Blank cells that neither player can reach are dropped, and the key is
+    the smallest encoding `blank | loc << n | other_loc << (n + b)` (with `n`
+    cells and `b` bits per cell index) over the symmetries of the board, so
+    that all the positions that play the same get the same key.
+
+    Returns
+    -------
+    (int, int)
+        The key, and the number of reachable blank cells.
+    """
+    masks = get_move_tables(width, height).masks
+    blank &= reachable_mask(masks, loc, blank) | reachable_mask(masks, other_loc, blank)
+    cells = mask_cells(blank)
+    size = width * height
+    loc_shift = size
+    other_shift = size + size.bit_length()
+    best = None
+    for permutation in get_symmetries(width, height):
+        key = permutation[loc] << loc_shift | permutation[other_loc] << other_shift
+        for cell in cells:
+            key |= 1 << permutation[cell]
+        if best is None or key < best:
+            best = key
+    return best, len(cells)
+
+
+def decode_key(width, height, key):
+    """Return the (<blank mask>, <location to move>, <other location>) of a
+    canonical key.
+    """
+    size = width * height
+    bits = size.bit_length()
+    index_mask = (1 << bits) - 1
+    return key & ((1 << size) - 1), key >> size & index_mask, key >> (size + bits) & index_mask
+
+
+def encode_value(win, plies):
+    """Pack a result into a slot value: whether the player to move wins, and
+    the number of moves left in the game with best play (the winner ends the
+    game as soon as it can, the loser as late as it can).
+    """
+    return 1 + 2 * plies + bool(win)
+
+
+def decode_value(value):
+    """Unpack a slot value into a tuple (<win>, <plies>)."""
+    return bool((value - 1) & 1), (value - 1) >> 1
+
+
+class Tablebase:
+    """Read-only view of a tablebase file generated by `generate()`.
+
+    Parameters
+    ----------
+    path : str
+        Path of the tablebase file.
+
+    Attributes
+    ----------
+    width, height : int
+        Size of the board the tablebase was generated for.
+
+    max_blank : int
+        Largest number of reachable blank cells of the positions it holds.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self._mmap, 0) if len(self._mmap) >= HEADER.size else (None, None)
+        if header[:2] != (MAGIC, VERSION):
+            self._mmap.close()
+            raise ValueError("{} is not a version {} tablebase file.".format(path, VERSION))
+        _, _, self.width, self.height, self.max_blank, self._slots, self._entries = header
+        self._shift = 64 - (self._slots.bit_length() - 1)
+        self._tables = get_move_tables(self.width, self.height)
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def __len__(self):
+        return self._entries
+
+    def lookup(self, key):
+        """ return the slot value stored for an exact key, or 0 """
+        slots_mask = self._slots - 1
+        slot = (key * HASH_MULTIPLIER & 0xFFFFFFFFFFFFFFFF) >> self._shift
+        while True:
+            stored, value = SLOT.unpack_from(self._mmap, HEADER.size + slot * SLOT.size)
+            if not value or stored == key:
+                return value
+            slot = (slot + 1) & slots_mask
+
+    def probe(self, game):
+        """Return the value of the position for the player to move, or None
+        if the tablebase does not hold it: when the board size differs, when
+        a player has not moved yet or when too many blank cells are
+        reachable.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            An instance of `isolation.Board` encoding the current state of the
+            game.
+
+        Returns
+        -------
+        (bool, int) or None
+            Whether the player to move wins, and the number of moves left in
+            the game with best play.
+        """
+        state = self._game_state(game)
+        return None if state is None else self._probe(*state)
+
+    def best_move(self, game):
+        """Return the best move of the player to move, or None if the
+        tablebase does not hold the position (see probe()): the move to the
+        lost position for the opponent that ends the game soonest, or when
+        the position is lost, the move that delays the end longest.
+
+        Returns
+        -------
+        (int, int) or None
+            Board coordinates of the best move, or (-1, -1) if there are no
+            legal moves.
+        """
+        state = self._game_state(game)
+        if state is None or self._probe(*state) is None:
+            return None
+        blank, loc, other_loc = state
+        best, best_rank = (-1, -1), None
+        moves = self._tables.masks[loc] & blank
+        while moves:
+            low = moves & -moves
+            move = low.bit_length() - 1
+            moves ^= low
+            win, plies = self._probe(blank & ~low, other_loc, move)
+            # prefer a win for this player (a loss for the opponent) soonest, then a loss latest
+            rank = (not win, -plies if not win else plies)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = self._tables.coords[move], rank
+        return best
+
+    def close(self):
+        """ unmap the file """
+        self._mmap.close()
+
+    def _probe(self, blank, loc, other_loc):
+        """ return the (<win>, <plies>) of a position given as masks and cell indices, or None """
+        key, count = canonical_key(self.width, self.height, blank, loc, other_loc)
+        if count > self.max_blank:
+            return None
+        value = self.lookup(key)
+        return decode_value(value) if value else None
+
+    def _game_state(self, game):
+        """ return the (<blank mask>, <location to move>, <other location>) of a game, or None if the
+            tablebase cannot hold it
+        """
+        if (game.width, game.height) != (self.width, self.height):
+            return None
+        state = position_masks(game)
+        return None if None in state[1:] else state
+
+
+def generate(path, width, height, max_blank, load_factor=0.5):
+    """Solve every position of a board size with at most `max_blank`
+    reachable blank cells and write them to a tablebase file.
+
+    The positions are enumerated by number of reachable blank cells: those
+    with one more cell are found by adding a cell next to a player or to a
+    reachable cell of a position with one fewer. Every move blocks a cell,
+    so the positions after a move have fewer blank cells: solving the
+    positions in that order means the successors of each position are
+    always solved first, with no iteration as the game has no cycles.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file to write; an existing file is replaced.
+
+    width, height : int
+        Size of the board.
+
+    max_blank : int
+        Largest number of reachable blank cells of the positions to solve;
+        the number of positions grows steeply with it.
+
+    load_factor : float (optional)
+        Largest fraction of the slots of the file holding a position.
+
+    Returns
+    -------
+    Tablebase
+        The generated tablebase.
+    """
+    size = width * height
+    if size + 2 * size.bit_length() > 64:
+        raise ValueError("The keys of a {}x{} board do not fit in 64 bits.".format(width, height))
+    masks = get_move_tables(width, height).masks
+    values = {}
+
+    # positions without reachable blank cells: the player to move loses at once
+    level = set()
+    for loc in range(size):
+        for other_loc in range(size):
+            if loc != other_loc:
+                level.add(canonical_key(width, height, 0, loc, other_loc)[0])
+    for key in level:
+        values[key] = encode_value(False, 0)
+
+    for count in range(1, max_blank + 1):
+        # grow the positions of the previous level by one reachable blank cell
+        previous, level = level, set()
+        for key in previous:
+            blank, loc, other_loc = decode_key(width, height, key)
+            frontier = masks[loc] | masks[other_loc]
+            cells = blank
+            while cells:
+                low = cells & -cells
+                frontier |= masks[low.bit_length() - 1]
+                cells ^= low
+            frontier &= ~(blank | 1 << loc | 1 << other_loc)
+            while frontier:
+                low = frontier & -frontier
+                frontier ^= low
+                level.add(canonical_key(width, height, blank | low, loc, other_loc)[0])
+
+        # solve them from the positions after each move, which have fewer blank cells
+        for key in level:
+            blank, loc, other_loc = decode_key(width, height, key)
+            win, win_plies, loss_plies = False, None, 0
+            moves = masks[loc] & blank
+            while moves:
+                low = moves & -moves
+                move = low.bit_length() - 1
+                moves ^= low
+                child_win, child_plies = decode_value(
+                    values[canonical_key(width, height, blank & ~low, other_loc, move)[0]])
+                if not child_win:
+                    win = True
+                    win_plies = child_plies if win_plies is None else min(win_plies, child_plies)
+                else:
+                    loss_plies = max(loss_plies, child_plies)
+            if win:
+                values[key] = encode_value(True, win_plies + 1)
+            else:
+                values[key] = encode_value(False, loss_plies + 1 if masks[loc] & blank else 0)
+
+    _write(path, width, height, max_blank, values, load_factor)
+    return Tablebase(path)
+
+
+def _write(path, width, height, max_blank, values, load_factor):
+    """ write the solved positions to an open addressing hash table in a tablebase file """
+    slots = 1 << max(1, int(len(values) / load_factor) - 1).bit_length()
+    shift = 64 - (slots.bit_length() - 1)
+    data = bytearray(HEADER.size + slots * SLOT.size)
+    HEADER.pack_into(data, 0, MAGIC, VERSION, width, height, max_blank, slots, len(values))
+    for key, value in values.items():
+        slot = (key * HASH_MULTIPLIER & 0xFFFFFFFFFFFFFFFF) >> shift
+        while SLOT.unpack_from(data, HEADER.size + slot * SLOT.size)[1]:
+            slot = (slot + 1) & (slots - 1)
+        SLOT.pack_into(data, HEADER.size + slot * SLOT.size, key, value)
+    # write to a temporary file first, so that a table open in another process is never half written
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
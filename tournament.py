@@ -60,6 +60,9 @@ def play_round(cpu_agent, test_agents, win_counts, num_matches):
 
         # play all games and tally the results
         for game in games:
+            for player in (game.active_player, game.inactive_player):
+                if hasattr(player, 'new_game'):
+                    player.new_game()
             winner, _, termination = game.play(time_limit=TIME_LIMIT)
             win_counts[winner] += 1
 
@@ -131,6 +134,12 @@ def play_matches(cpu_agents, test_agents, num_matches):
             avg_time = 1000.0 * (sum(player.time_logging)/float(len(player.time_logging)))
             print("Average evaluation {} {}ms".format(test_agent.name, round(avg_time, 3)))
 
+    for test_agent in test_agents:
+        table = getattr(test_agent.player, 'transporition_table', None)
+        if table is not None and table.probes:
+            print("Transposition table {}: {:.1f}% hit rate, {:.1f}% cutoff rate, {:.1f}% occupancy".format(
+                test_agent.name, 100 * table.hit_rate, 100 * table.cutoff_rate, 100 * table.occupancy))
+
 def main():
 
     # Define two agents to compare -- these agents will play from the same